@@ -36,6 +36,15 @@ if env('REDIS_URL', default=None):
         }
     }
 
+# Redis cache shared by the web and Celery processes
+if env('REDIS_URL', default=None):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': env('REDIS_URL'),
+        }
+    }
+
 # Celery settings
 if env('REDIS_URL', default=None):
     CELERY_BROKER_URL = env('REDIS_URL')
@@ -1,4 +1,5 @@
 from django.db.models.signals import post_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from workspace.models import FileAttachment
 from .models import FileIndex
@@ -24,10 +25,14 @@ def create_file_index(sender, instance, created, **kwargs):
                 except Exception as e:
                     logger.error(f"Error indexing file {instance.name}: {str(e)}")
             
-            # Run in a separate thread to not block the main thread
-            thread = Thread(target=index_file_task)
-            thread.daemon = True
-            thread.start()
+            def start_indexing():
+                # Run in a separate thread to not block the main thread
+                thread = Thread(target=index_file_task)
+                thread.daemon = True
+                thread.start()
+            
+            # Wait for the commit so the thread's own connection can see the file row
+            transaction.on_commit(start_indexing)
             
         except Exception as e:
             logger.error(f"Error starting indexing thread for {instance.name}: {str(e)}")
@@ -1,4 +1,4 @@
-from django.test import TestCase, Client, RequestFactory
+from django.test import TestCase, RequestFactory
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -8,8 +8,6 @@ from django.db.models import Q
 
 import json
 import datetime
-import tempfile
-import os
 from unittest.mock import patch, MagicMock
 
 from workspace.models import WorkItem, Message, Thread, FileAttachment, SlowChannel
@@ -285,24 +283,13 @@ class SearchIndexingTests(TestCase):
             owner=self.user
         )
         
-        # Create a temporary text file for testing
-        self.temp_file = tempfile.NamedTemporaryFile(suffix='.txt', delete=False)
-        self.temp_file.write(b"This is a test file content for indexing tests")
-        self.temp_file.close()
-        
-        # Create file attachment with the temp file
-        with open(self.temp_file.name, 'rb') as f:
-            self.file = FileAttachment.objects.create(
-                work_item=self.work_item,
-                file=SimpleUploadedFile("test.txt", f.read()),
-                name="test.txt",
-                uploaded_by=self.user
-            )
-    
-    def tearDown(self):
-        """Clean up temporary files"""
-        if os.path.exists(self.temp_file.name):
-            os.unlink(self.temp_file.name)
+        # Create file attachment from in-memory content
+        self.file = FileAttachment.objects.create(
+            work_item=self.work_item,
+            file=SimpleUploadedFile("test.txt", b"This is a test file content for indexing tests"),
+            name="test.txt",
+            uploaded_by=self.user
+        )
     
     @patch('search.indexing.extract_text_from_file_in_chunks')
     def test_index_file(self, mock_extract):
@@ -421,9 +408,7 @@ class SearchViewTests(TestCase):
     """Tests for search views"""
     
     def setUp(self):
-        """Set up test data and client"""
-        self.client = Client()
-        
+        """Set up test data"""
         # Create users
         self.user = User.objects.create_user(
             username='testuser',
@@ -583,7 +568,7 @@ class SearchViewTests(TestCase):
     
     def test_search_view_authenticated_no_query(self):
         """Test search view for authenticated user with no query"""
-        self.client.login(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
         response = self.client.get(self.search_url)
         
         self.assertEqual(response.status_code, 200)
@@ -603,7 +588,7 @@ class SearchViewTests(TestCase):
         mock_search_messages.return_value = Message.objects.filter(pk=mock_message.pk)
         
         # Login the user
-        self.client.login(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
         
         # Call the search view with the query
         response = self.client.get(f"{self.search_url}?q=alpha")
@@ -622,7 +607,7 @@ class SearchViewTests(TestCase):
     
     def test_search_view_with_content_type_filter(self):
         """Test search view with content type filter"""
-        self.client.login(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
         response = self.client.get(f"{self.search_url}?q=alpha&content_types=work_item")
         
         self.assertEqual(response.status_code, 200)
@@ -637,7 +622,7 @@ class SearchViewTests(TestCase):
     
     def test_search_view_with_type_filter(self):
         """Test search view with work item type filter"""
-        self.client.login(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
         response = self.client.get(f"{self.search_url}?q=&type=project")
         
         self.assertEqual(response.status_code, 200)
@@ -649,7 +634,7 @@ class SearchViewTests(TestCase):
     
     def test_search_view_with_date_filter(self):
         """Test search view with date filter"""
-        self.client.login(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
         
         # Create a work item with older date
         old_item = WorkItem.objects.create(
@@ -741,7 +726,7 @@ class SearchViewTests(TestCase):
     
     def test_saved_searches_view(self):
         """Test saved searches list view"""
-        self.client.login(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
         response = self.client.get(self.saved_searches_url)
         
         self.assertEqual(response.status_code, 200)
@@ -750,7 +735,7 @@ class SearchViewTests(TestCase):
     
     def test_create_saved_search(self):
         """Test creating a new saved search"""
-        self.client.login(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
         
         # First perform a search to store in session
         self.client.get(f"{self.search_url}?q=beta&type=task")
@@ -781,7 +766,7 @@ class SearchViewTests(TestCase):
     
     def test_saved_search_detail_view(self):
         """Test viewing a saved search"""
-        self.client.login(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
         response = self.client.get(self.saved_search_detail_url)
         
         # Should redirect to search with the saved parameters
@@ -793,7 +778,7 @@ class SearchViewTests(TestCase):
     
     def test_delete_saved_search(self):
         """Test deleting a saved search"""
-        self.client.login(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
         response = self.client.post(self.delete_saved_search_url)
         
         # Should redirect to saved searches list
@@ -813,7 +798,7 @@ class SearchViewTests(TestCase):
             filters='{}'
         )
         
-        self.client.login(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
         response = self.client.post(reverse('set_default_search', args=[second_search.pk]))
         
         # Should redirect to saved searches list
@@ -841,7 +826,7 @@ class SearchViewTests(TestCase):
             results_count=10
         )
         
-        self.client.login(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
         response = self.client.post(self.clear_search_history_url)
         
         # Should redirect to search
@@ -1004,14 +989,21 @@ class SearchSignalTests(TestCase):
     
     @patch('search.signals.index_file')
     def test_file_attachment_create_signal(self, mock_index_file):
-        """Test that creating a FileAttachment triggers indexing"""
-        # Create a file attachment
-        file = FileAttachment.objects.create(
-            work_item=self.work_item,
-            file=SimpleUploadedFile("test.txt", b"Test content"),
-            name="test.txt",
-            uploaded_by=self.user
-        )
+        """Test that creating a FileAttachment triggers indexing once committed"""
+        # Create a file attachment; indexing only starts when the transaction commits
+        with patch('threading.Thread') as mock_thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                file = FileAttachment.objects.create(
+                    work_item=self.work_item,
+                    file=SimpleUploadedFile("test.txt", b"Test content"),
+                    name="test.txt",
+                    uploaded_by=self.user
+                )
+                mock_thread.assert_not_called()
+        
+        # Run the background indexing task in this thread
+        mock_thread.return_value.start.assert_called_once()
+        mock_thread.call_args.kwargs['target']()
         
         # Verify index_file was called
         mock_index_file.assert_called_once_with(file)
@@ -1,4 +1,4 @@
-from django.test import TestCase, Client
+from django.test import TestCase
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -149,8 +149,7 @@ class UserViewsTests(TestCase):
     """Tests for User-related views"""
 
     def setUp(self):
-        """Set up test data and client"""
-        self.client = Client()
+        """Set up test data"""
         self.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
@@ -244,7 +243,7 @@ class UserViewsTests(TestCase):
     def test_logout_view(self):
         """Test logout functionality"""
         # First login
-        self.client.login(username='testuser', password='testpassword123')
+        self.client.force_login(self.user)
         
         # Then logout
         response = self.client.get(self.logout_url)
@@ -265,7 +264,7 @@ class UserViewsTests(TestCase):
 
     def test_profile_view_authenticated(self):
         """Test profile view for authenticated user"""
-        self.client.login(username='testuser', password='testpassword123')
+        self.client.force_login(self.user)
         response = self.client.get(self.profile_url)
         
         self.assertEqual(response.status_code, 200)
@@ -275,7 +274,7 @@ class UserViewsTests(TestCase):
         
     def test_profile_update(self):
         """Test updating profile information"""
-        self.client.login(username='testuser', password='testpassword123')
+        self.client.force_login(self.user)
         
         # Data for updating profile
         form_data = {
@@ -134,28 +134,31 @@ class ChatConsumer(AsyncWebsocketConsumer):
         
     @database_sync_to_async
     def create_notifications(self, message_obj, sender_id):
+        from .utils import adjust_unread_notification_count
         try:
-            sender = User.objects.get(pk=sender_id)
             work_item = message_obj.work_item
             
             # Create notifications for owner and all collaborators except the message sender
-            recipients = set()
-            if work_item.owner.id != int(sender_id):
-                recipients.add(work_item.owner)
+            recipient_ids = set()
+            if work_item.owner_id != int(sender_id):
+                recipient_ids.add(work_item.owner_id)
             
-            collaborators = work_item.collaborators.exclude(id=sender_id)
-            recipients.update(collaborators)
+            recipient_ids.update(work_item.collaborators.exclude(id=sender_id).values_list('id', flat=True))
 
-            print(f"Creating notifications for {len(recipients)} recipients")
+            print(f"Creating notifications for {len(recipient_ids)} recipients")
             
-            for recipient in recipients:
-                Notification.objects.create(
-                    user=recipient,
-                    message=f"{sender.username} sent a message in '{work_item.title}'",
+            notifications = Notification.objects.bulk_create([
+                Notification(
+                    user_id=recipient_id,
+                    message=f"{message_obj.user.username} sent a message in '{work_item.title}'",
                     work_item=work_item,
                     notification_type='message'
                 )
-                print(f"Notification created for {recipient.username}")
+                for recipient_id in recipient_ids
+            ])
+            # bulk_create skips post_save, so bump the unread counters here
+            for notification in notifications:
+                adjust_unread_notification_count(notification.user_id, 1)
         except Exception as e:
             print(f"Error creating notifications: {str(e)}")
 
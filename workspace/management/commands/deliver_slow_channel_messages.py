@@ -3,6 +3,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from workspace.models import SlowChannelMessage
+from workspace.tasks import DELIVERY_BATCH_SIZE
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,40 +14,64 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         now = timezone.now()
         
-        # Get all undelivered messages that are due
+        # All undelivered messages that are due; only the count is read up front
         due_messages = SlowChannelMessage.objects.filter(
             is_delivered=False,
             scheduled_delivery__lte=now
         )
+        due_count = due_messages.count()
         
-        if not due_messages.exists():
+        if not due_count:
             self.stdout.write(self.style.SUCCESS('No slow channel messages are due for delivery'))
             return
             
-        self.stdout.write(f'Found {due_messages.count()} slow channel messages to deliver')
+        self.stdout.write(f'Found {due_count} slow channel messages to deliver')
+        
+        # Per-message lines are skipped at --verbosity 0; the count and summary are always written
+        report_each = options['verbosity'] >= 1
         
         # Keep track of successes and failures
+        processed_count = 0
         success_count = 0
         fail_count = 0
         
-        # Process each message
-        for message in due_messages:
+        # Walk the backlog in id order a batch at a time so memory stays flat however long it is
+        last_id = 0
+        while True:
+            batch = list(
+                due_messages.filter(id__gt=last_id)
+                .select_related('user', 'channel')
+                .order_by('id')[:DELIVERY_BATCH_SIZE]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            processed_count += len(batch)
+            
+            # Flag the batch with one UPDATE; rows a worker delivered in the meantime are not counted
             try:
-                message.mark_delivered()
-                success_count += 1
-                self.stdout.write(self.style.SUCCESS(
-                    f'Delivered slow channel message #{message.id} from {message.user.username} '
-                    f'in channel "{message.channel.title}"'
-                ))
+                delivered_count = SlowChannelMessage.objects.filter(
+                    id__in=[message.id for message in batch],
+                    is_delivered=False
+                ).update(is_delivered=True, delivered_at=now)
             except Exception as e:
-                fail_count += 1
-                logger.error(f'Error delivering slow channel message #{message.id}: {str(e)}')
+                delivered_count = 0
+                logger.error(f'Error delivering {len(batch)} slow channel messages: {str(e)}')
                 self.stdout.write(self.style.ERROR(
-                    f'Error delivering slow channel message #{message.id}: {str(e)}'
+                    f'Error delivering {len(batch)} slow channel messages: {str(e)}'
                 ))
+            success_count += delivered_count
+            fail_count += len(batch) - delivered_count
+            
+            if report_each and delivered_count == len(batch):
+                for message in batch:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'Delivered slow channel message #{message.id} from {message.user.username} '
+                        f'in channel "{message.channel.title}"'
+                    ))
                 
         # Summary
         self.stdout.write(self.style.SUCCESS(
-            f'Processed {due_messages.count()} slow channel messages: '
+            f'Processed {processed_count} slow channel messages: '
             f'{success_count} delivered successfully, {fail_count} failed'
-        ))
\ No newline at end of file
+        ))
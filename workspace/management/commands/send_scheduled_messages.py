@@ -1,9 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from workspace.models import ScheduledMessage
-import logging
-
-logger = logging.getLogger(__name__)
+from workspace.tasks import send_scheduled_message_batch
 
 class Command(BaseCommand):
     help = 'Sends scheduled messages that are due'
@@ -11,47 +9,42 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         now = timezone.now()
         
-        # Get all unsent messages that are due
-        due_messages = ScheduledMessage.objects.filter(
-            is_sent=False,
-            scheduled_time__lte=now
+        # Get all unsent messages that are due, evaluated once
+        due_messages = list(
+            ScheduledMessage.objects.filter(
+                is_sent=False,
+                scheduled_time__lte=now
+            ).select_related('sender')
         )
         
-        if not due_messages.exists():
+        if not due_messages:
             self.stdout.write(self.style.SUCCESS('No scheduled messages are due'))
             return
             
-        self.stdout.write(f'Found {due_messages.count()} scheduled messages to send')
+        self.stdout.write(f'Found {len(due_messages)} scheduled messages to send')
         
-        # Keep track of successes and failures
-        success_count = 0
-        fail_count = 0
+        # Per-message lines are skipped at --verbosity 0; the count and summary are always written
+        report_each = options['verbosity'] >= 1
         
-        # Process each message
-        for scheduled_msg in due_messages:
-            try:
-                # Send the message
-                message = scheduled_msg.send()
-                
-                if message:
-                    success_count += 1
+        # Send them the same way the Celery task does: one INSERT for the messages, one UPDATE for the flags
+        result = send_scheduled_message_batch([scheduled_msg.id for scheduled_msg in due_messages])
+        success_count = result['sent']
+        fail_count = len(due_messages) - success_count
+        
+        if report_each:
+            if fail_count:
+                # The batch doesn't say which rows it skipped, so report the shortfall as a whole
+                self.stdout.write(self.style.ERROR(
+                    f'Failed to send {fail_count} scheduled messages (already sent or other issue)'
+                ))
+            else:
+                for scheduled_msg in due_messages:
                     self.stdout.write(self.style.SUCCESS(
                         f'Sent scheduled message #{scheduled_msg.id} from {scheduled_msg.sender.username}'
                     ))
-                else:
-                    fail_count += 1
-                    self.stdout.write(self.style.ERROR(
-                        f'Failed to send scheduled message #{scheduled_msg.id} (already sent or other issue)'
-                    ))
-            except Exception as e:
-                fail_count += 1
-                logger.error(f'Error sending scheduled message #{scheduled_msg.id}: {str(e)}')
-                self.stdout.write(self.style.ERROR(
-                    f'Error sending scheduled message #{scheduled_msg.id}: {str(e)}'
-                ))
                 
         # Summary
         self.stdout.write(self.style.SUCCESS(
-            f'Processed {due_messages.count()} scheduled messages: '
+            f'Processed {len(due_messages)} scheduled messages: '
             f'{success_count} sent successfully, {fail_count} failed'
-        ))
\ No newline at end of file
+        ))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 18:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workspace', '0004_message_is_from_websocket'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scheduledmessage',
+            index=models.Index(condition=models.Q(('is_sent', False)), fields=['scheduled_time'], name='sm_due_partial'),
+        ),
+        migrations.AddIndex(
+            model_name='slowchannelmessage',
+            index=models.Index(condition=models.Q(('is_delivered', False)), fields=['scheduled_delivery'], name='scm_due_partial'),
+        ),
+    ]
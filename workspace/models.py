@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 import datetime
@@ -166,6 +166,11 @@ class Notification(models.Model):
     def __str__(self):
         return f"Notification for {self.user.username}: {self.message[:30]}"
     
+    def get_sender_id(self):
+        """ID of the user this notification counts as coming from, for focus mode"""
+        # Notifications don't store who triggered them, so attribute them to the work item owner
+        return self.work_item.owner_id if self.work_item else None
+    
 class NotificationPreference(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='notification_preferences')
     
@@ -258,18 +263,20 @@ class NotificationPreference(models.Model):
     def __str__(self):
         return f"{self.user.username}'s notification preferences"
     
-    def is_in_dnd_period(self):
-        """Check if current time is within DND period"""
+    def is_in_dnd_period(self, now=None):
+        """Check if current time (or the given local datetime) is within DND period"""
         if not self.dnd_enabled or not self.dnd_start_time or not self.dnd_end_time:
             return False
             
-        from django.utils import timezone
-        now = timezone.localtime().time()
+        if now is None:
+            from django.utils import timezone
+            now = timezone.localtime()
+        now = now.time()
         
         # Debug info to help troubleshoot
         import logging
         logger = logging.getLogger(__name__)
-        logger.info(f"DND check: now={now}, start={self.dnd_start_time}, end={self.dnd_end_time}")
+        logger.debug("DND check: now=%s, start=%s, end=%s", now, self.dnd_start_time, self.dnd_end_time)
         
         # Handle case where DND period spans midnight
         if self.dnd_start_time > self.dnd_end_time:
@@ -277,20 +284,80 @@ class NotificationPreference(models.Model):
         else:
             result = self.dnd_start_time <= now <= self.dnd_end_time
             
-        logger.info(f"DND period check result: {result}")
+        logger.debug("DND period check result: %s", result)
         return result
     
-    def should_notify(self, work_item=None, thread=None):
+    def should_notify(self, work_item=None, thread=None, now=None):
         """Determine if user should be notified based on preferences"""
-        # Check DND period
-        if self.is_in_dnd_period():
+        # Check DND period and work hours
+        if self.is_quiet_time(work_item, now=now):
             return False
             
-        # Check work hours
+        # Check notification mode
+        if self.notification_mode == 'none':
+            return False
+            
+        if not work_item and not thread:
+            return True
+            
+        # Without a shared cache the snapshot is rebuilt on every call, so
+        # check the lists on this row with targeted queries instead
+        from .utils import _cache_is_shared, get_preferences_snapshot
+        if not _cache_is_shared():
+            return not self._is_muted_or_out_of_focus(work_item, thread)
+        
+        # Muted and focus lists come from the cached snapshot as id sets
+        snapshot = get_preferences_snapshot(self.user_id)
+        if snapshot is None:
+            return True
+            
+        # Check muted channels
+        if work_item and work_item.id in snapshot.muted_channel_ids:
+            return False
+            
+        # Check muted threads
+        if thread and thread.id in snapshot.muted_thread_ids:
+            return False
+                
+        # Check focus mode
+        if self.focus_mode:
+            if work_item and work_item.id not in snapshot.focus_work_item_ids:
+                # Only block if the work item is not in the focus list
+                if work_item.owner_id and work_item.owner_id not in snapshot.focus_user_ids:
+                    # And if the owner is not in the focus users list
+                    return False
+                    
+        return True
+    
+    def _is_muted_or_out_of_focus(self, work_item=None, thread=None):
+        """Check the muted and focus lists with one EXISTS query per list that applies"""
+        if work_item and self.muted_channels.filter(id=work_item.id).exists():
+            return True
+        
+        if thread and self.muted_threads.filter(id=thread.id).exists():
+            return True
+        
+        if self.focus_mode and work_item and not self.focus_work_items.filter(id=work_item.id).exists():
+            # Only block if the owner isn't in the focus users list either
+            if work_item.owner_id and not self.focus_users.filter(id=work_item.owner_id).exists():
+                return True
+        
+        return False
+    
+    def is_quiet_time(self, work_item=None, now=None):
+        """Check if notifications should be held back because of DND or work hours"""
         from django.utils import timezone
         import datetime
         
-        now = timezone.localtime()
+        # Read the clock once and share it between the DND and work hours checks
+        if now is None:
+            now = timezone.localtime()
+        
+        # Check DND period
+        if self.is_in_dnd_period(now):
+            return True
+            
+        # Check work hours
         current_weekday = str(now.weekday() + 1)  # 1 is Monday in our system
         current_time = now.time()
         
@@ -322,29 +389,9 @@ class NotificationPreference(models.Model):
         # Only apply work hours restriction if dnd_enabled is True
         # This fixes the test where we want to receive notifications anytime
         if not in_work_hours and self.dnd_enabled and work_item and not getattr(work_item, 'priority', 'normal') == 'high':
-            return False
-            
-        # Check notification mode
-        if self.notification_mode == 'none':
-            return False
-            
-        # Check muted channels
-        if work_item and self.muted_channels.filter(id=work_item.id).exists():
-            return False
+            return True
             
-        # Check muted threads
-        if thread and self.muted_threads.filter(id=thread.id).exists():
-            return False
-                
-        # Check focus mode
-        if self.focus_mode:
-            if work_item and not self.focus_work_items.filter(id=work_item.id).exists():
-                # Only block if the work item is not in the focus list
-                if work_item.owner and not self.focus_users.filter(id=work_item.owner.id).exists():
-                    # And if the owner is not in the focus users list
-                    return False
-                    
-        return True
+        return False
     
 
 class Thread(models.Model):
@@ -484,11 +531,27 @@ class ScheduledMessage(models.Model):
     
     class Meta:
         ordering = ['scheduled_time']
+        indexes = [
+            # Small index over unsent rows only, for the periodic due-message scan
+            models.Index(fields=['scheduled_time'], condition=models.Q(is_sent=False), name='sm_due_partial'),
+        ]
     
     def __str__(self):
         sent_status = "Sent" if self.is_sent else "Scheduled"
         return f"{sent_status} message by {self.sender.username} for {self.scheduled_time}"
     
+    def build_message(self):
+        """Return the unsaved Message this scheduled message turns into"""
+        return Message(
+            work_item=self.work_item,
+            thread=self.thread,
+            user=self.sender,
+            content=self.content,
+            parent=self.parent_message,
+            is_thread_starter=False,
+            is_scheduled=True  # Add this field to Message model
+        )
+    
     def send(self):
         """Send this scheduled message by creating an actual Message"""
         if self.is_sent:
@@ -496,15 +559,8 @@ class ScheduledMessage(models.Model):
             
         try:
             # Create the actual message
-            message = Message.objects.create(
-                work_item=self.work_item,
-                thread=self.thread,
-                user=self.sender,
-                content=self.content,
-                parent=self.parent_message,
-                is_thread_starter=False,
-                is_scheduled=True  # Add this field to Message model
-            )
+            message = self.build_message()
+            message.save()
             
             # Mark as sent
             self.is_sent = True
@@ -528,32 +584,33 @@ class ScheduledMessage(models.Model):
     
     def _create_notifications(self, message):
         """Create notifications for the message recipients"""
+        from .signals import _notify_users
+        
         try:
             # Determine recipients based on work item and thread
-            recipients = set()
+            recipient_ids = set()
             
             # Add work item owner if not the sender
-            if self.work_item.owner != self.sender:
-                recipients.add(self.work_item.owner)
-            
+            if self.work_item.owner_id != self.sender_id:
+                recipient_ids.add(self.work_item.owner_id)
+                
             # Add collaborators except sender
-            collaborators = self.work_item.collaborators.exclude(id=self.sender.id)
-            recipients.update(collaborators)
+            recipient_ids.update(
+                self.work_item.collaborators.exclude(id=self.sender_id).values_list('id', flat=True)
+            )
             
             # If thread exists, only include thread participants
             if self.thread:
-                thread_participants = self.thread.get_participants()
-                recipients = recipients.intersection(thread_participants)
+                recipient_ids &= {participant.id for participant in self.thread.get_participants()}
                 
-            # Create notifications
-            for recipient in recipients:
-                Notification.objects.create(
-                    user=recipient,
-                    message=f"{self.sender.username} sent a scheduled message in '{self.work_item.title}'",
-                    work_item=self.work_item,
-                    thread=self.thread,
-                    notification_type='message'
-                )
+            # Create the notifications in one batch
+            _notify_users(
+                recipient_ids,
+                message=f"{self.sender.username} sent a scheduled message in '{self.work_item.title}'",
+                work_item=self.work_item,
+                thread=self.thread,
+                notification_type='message'
+            )
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
@@ -705,6 +762,10 @@ class SlowChannelMessage(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Small index over undelivered rows only, for the periodic delivery scan
+            models.Index(fields=['scheduled_delivery'], condition=models.Q(is_delivered=False), name='scm_due_partial'),
+        ]
     
     def __str__(self):
         return f"{self.user.username}: {self.content[:50]}"
@@ -721,8 +782,12 @@ class SlowChannelMessage(models.Model):
         # Mark as delivered
         self.mark_delivered()
         
+        return self.notify_participants()
+    
+    def notify_participants(self):
+        """Create notifications for participants without touching the delivery flags"""
         # Create notifications for all participants except the sender
-        participants = self.channel.participants.exclude(id=self.user.id)
+        participants = self.channel.participants.exclude(id=self.user_id).select_related('notification_preferences')
         
         # Create a notification for each participant
         for participant in participants:
@@ -730,13 +795,15 @@ class SlowChannelMessage(models.Model):
             try:
                 preferences = participant.notification_preferences
                 if preferences.should_notify(work_item=self.channel.work_item):
-                    Notification.objects.create(
-                        user=participant,
-                        message=f"New message in slow channel '{self.channel.title}'",
-                        work_item=self.channel.work_item,
-                        notification_type='message',
-                        priority='normal'
-                    )
+                    # Savepoint so a failed insert doesn't abort the caller's transaction
+                    with transaction.atomic():
+                        Notification.objects.create(
+                            user=participant,
+                            message=f"New message in slow channel '{self.channel.title}'",
+                            work_item=self.channel.work_item,
+                            notification_type='message',
+                            priority='normal'
+                        )
             except Exception as e:
                 import logging
                 logger = logging.getLogger(__name__)
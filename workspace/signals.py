@@ -1,6 +1,14 @@
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.db import transaction
 from django.dispatch import receiver
+from django.utils import timezone
 from .models import Message, WorkItem, Notification, FileAttachment, NotificationPreference
+from .utils import (
+    MODE_NONE, MODE_MENTIONS,
+    get_preferences_snapshot, get_preferences_snapshots, invalidate_preferences_snapshots,
+    get_unread_notification_count, adjust_unread_notification_count, invalidate_unread_notification_counts,
+)
 from django.contrib.auth.models import User
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
@@ -12,182 +20,223 @@ logger = logging.getLogger(__name__)
 # Get the channel layer for WebSocket communication
 channel_layer = get_channel_layer()
 
-def send_notification(notification):
+# Build the sync wrapper once instead of on every delivery
+_group_send = async_to_sync(channel_layer.group_send)
+
+# Outcomes of checking a notification against its recipient's preferences
+DELIVER = 'deliver'
+SKIP = 'skip'
+MUTED = 'muted'
+FOCUS_FILTERED = 'focus_filtered'
+DELAYED = 'delayed'
+
+# Flag stored on the Notification row for each filtered outcome
+_OUTCOME_FLAGS = {
+    MUTED: 'is_from_muted',
+    FOCUS_FILTERED: 'is_focus_filtered',
+    DELAYED: 'is_delayed',
+}
+
+def evaluate_notification(notification, preferences, now=None):
     """
-    Central function to handle notification sending logic.
-    Checks user preferences and sends notifications accordingly.
+    Decide what should happen to a notification without touching the database.
+    Works on unsaved notifications so filter flags can be set before the INSERT.
     """
-    user = notification.user
     work_item = notification.work_item
-    thread = notification.thread if hasattr(notification, 'thread') else None
-    
-    print(f"Processing notification ID {notification.id}")
+    thread = notification.thread
     
     # Handle notification based on priority
     if notification.priority == 'urgent':
-        print("Urgent notification - bypassing filters")
-        _deliver_notification(notification)
-        return
+        logger.debug("Urgent notification - bypassing filters")
+        return DELIVER
     
-    # Check if user should receive notification based on preferences
-    try:
-        preferences = NotificationPreference.objects.get(user=user)
-        print(f"Found preferences, focus_mode={preferences.focus_mode}")
+    # No preferences stored: deliver as before
+    if preferences is None:
+        return DELIVER
+    logger.debug("Found preferences, focus_mode=%s", preferences.focus_mode)
+    
+    # If notification mode is set to none, don't deliver (nothing else to check)
+    if preferences.mode == MODE_NONE:
+        return SKIP
         
-        # FIRST, check for muted state
-        if work_item and preferences.muted_channels.filter(id=work_item.id).exists():
-            print(f"Work item {work_item.id} is muted")
-            notification.is_from_muted = True
-            notification.save()
-            return
-            
-        # Check if thread is muted
-        if thread and preferences.muted_threads.filter(id=thread.id).exists():
-            print(f"Thread {thread.id} is muted")
-            notification.is_from_muted = True
-            notification.save()
-            return
+    # If notification mode is set to mentions only and user isn't mentioned, don't deliver
+    if preferences.mode == MODE_MENTIONS and not is_user_mentioned(notification.message, preferences.mention_token):
+        return SKIP
+    
+    # FIRST, check for muted state
+    if work_item and work_item.id in preferences.muted_channel_ids:
+        logger.debug("Work item %s is muted", work_item.id)
+        return MUTED
         
-        # SECOND, check focus mode
-        if preferences.focus_mode:
-            print(f"Focus mode is ON")
-            
-            # Get focus work items and users directly from the database to avoid ORM issues
-            from django.db import connection
-            cursor = connection.cursor()
-            
-            # Get focus work item IDs
-            cursor.execute(
-                """
-                SELECT workitem_id 
-                FROM workspace_notificationpreference_focus_work_items
-                WHERE notificationpreference_id = %s
-                """, 
-                [preferences.id]
-            )
-            focus_work_item_ids = [row[0] for row in cursor.fetchall()]
-            
-            # Get focus user IDs
-            cursor.execute(
-                """
-                SELECT user_id 
-                FROM workspace_notificationpreference_focus_users
-                WHERE notificationpreference_id = %s
-                """, 
-                [preferences.id]
-            )
-            focus_user_ids = [row[0] for row in cursor.fetchall()]
-            
-            print(f"Focus work item IDs: {focus_work_item_ids}")
-            print(f"Current work item ID: {work_item.id}")
-            
-            # For focus mode, we need to check if this is from a selected user or work item
-            allow_notification = False
-            
-            # Check if work item is in focus list
-            if work_item and work_item.id in focus_work_item_ids:
-                print(f"Work item {work_item.id} is in focus list - allowing notification")
-                allow_notification = True
-            
-            # Get the sender (this could be different depending on notification type)
-            notification_sender = None
-            if hasattr(notification, 'get_sender'):
-                notification_sender = notification.get_sender()
-            elif work_item and hasattr(work_item, 'owner'):
-                notification_sender = work_item.owner
-            
-            # Check if sender is in focus users
-            if notification_sender and notification_sender.id in focus_user_ids:
-                print(f"Sender {notification_sender.id} is in focus list - allowing notification")
-                allow_notification = True
-            
-            # If not from a focused source, filter it
-            if not allow_notification:
-                print(f"FILTERING: Notification {notification.id} by focus mode")
-                
-                # Set directly in database to bypass ORM issues
-                cursor.execute(
-                    "UPDATE workspace_notification SET is_focus_filtered = 1 WHERE id = %s",
-                    [notification.id]
-                )
-                
-                # Verify the update worked
-                cursor.execute(
-                    "SELECT is_focus_filtered FROM workspace_notification WHERE id = %s",
-                    [notification.id]
-                )
-                result = cursor.fetchone()
-                print(f"Database value of is_focus_filtered after update: {result[0]}")
-                
-                return
+    # Check if thread is muted
+    if thread and thread.id in preferences.muted_thread_ids:
+        logger.debug("Thread %s is muted", thread.id)
+        return MUTED
+    
+    # SECOND, check focus mode
+    if preferences.focus_mode:
+        focus_work_item_ids = preferences.focus_work_item_ids
+        focus_user_ids = preferences.focus_user_ids
         
-        # THIRD, check normal conditions like DND and work hours  
-        if notification.priority == 'normal':
-            # Skip if the user has DND enabled or if this is outside work hours
-            should_notify_result = preferences.should_notify(work_item, thread)
-            print(f"Should notify result: {should_notify_result}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Focus mode is ON")
+            logger.debug("Focus work item IDs: %s", sorted(focus_work_item_ids))
         
-            if not should_notify_result:
-                # Mark the notification as delayed
-                notification.is_delayed = True
-                notification.save()
-                print(f"Notification {notification.id} delayed due to preferences")
-                return
+        # For focus mode, we need to check if this is from a selected user or work item
+        allow_notification = False
         
-        # If notification mode is set to none, don't deliver
-        if preferences.notification_mode == 'none':
-            notification.save()
-            return
-            
-        # If notification mode is set to mentions only and user isn't mentioned, don't deliver
-        if preferences.notification_mode == 'mentions' and not is_user_mentioned(getattr(notification, 'message', ''), user):
-            notification.save()
-            return
-            
-    except Exception as e:
-        print(f"Exception in send_notification: {str(e)}")
-        # If no preferences exist, continue with notification
+        # Check if work item is in focus list
+        if work_item and work_item.id in focus_work_item_ids:
+            logger.debug("Work item %s is in focus list - allowing notification", work_item.id)
+            allow_notification = True
+        
+        # Get the sender (this could be different depending on notification type)
+        notification_sender_id = notification.get_sender_id()
+        
+        # Check if sender is in focus users
+        if notification_sender_id and notification_sender_id in focus_user_ids:
+            logger.debug("Sender %s is in focus list - allowing notification", notification_sender_id)
+            allow_notification = True
+        
+        # If not from a focused source, filter it
+        if not allow_notification:
+            logger.debug("FILTERING: Notification %s by focus mode", notification.id)
+            return FOCUS_FILTERED
     
-    # If we made it here, deliver the notification
-    print(f"DELIVERING notification {notification.id}")
-    _deliver_notification(notification)
+    # THIRD, check normal conditions like DND and work hours  
+    if notification.priority == 'normal':
+        # Skip if the user has DND enabled or if this is outside work hours
+        # Muted and focus checks already ran above, so only the time window is left
+        if now is None:
+            now = timezone.localtime()
+        should_notify_result = not preferences.is_quiet_time(work_item, now=now)
+        logger.debug("Should notify result: %s", should_notify_result)
     
-def _deliver_notification(notification):
-    """Helper function to deliver a notification via WebSocket"""
+        if not should_notify_result:
+            logger.debug("Notification %s delayed due to preferences", notification.id)
+            return DELAYED
+    
+    return DELIVER
+
+def _resolve_outcome(notification, preferences, now=None):
+    """evaluate_notification, falling back to delivery if the preference check fails"""
     try:
-        notification_data = {
-            'id': notification.id,
-            'message': notification.message,
-            'work_item_id': notification.work_item.id if notification.work_item else None,
-            'created_at': notification.created_at.isoformat(),
-            'notification_type': notification.notification_type,
-            'priority': notification.priority
-        }
-        
-        async_to_sync(channel_layer.group_send)(
-            f'notifications_{notification.user.id}',
+        return evaluate_notification(notification, preferences, now=now)
+    except Exception:
+        logger.exception("Preference check failed for notification %s; delivering it anyway", notification.id)
+        return DELIVER
+
+def send_notification(notification, preferences=None):
+    """
+    Central function to handle notification sending logic.
+    Checks user preferences and sends notifications accordingly.
+    Callers that already loaded the recipient's PreferencesSnapshot can
+    pass it in to skip the cache lookup.
+    """
+    logger.debug("Processing notification ID %s", notification.id)
+    
+    if preferences is None and notification.priority != 'urgent':
+        preferences = get_preferences_snapshot(notification.user_id)
+    outcome = _resolve_outcome(notification, preferences)
+    
+    # Record why a filtered notification wasn't pushed
+    flag = _OUTCOME_FLAGS.get(outcome)
+    if flag:
+        setattr(notification, flag, True)
+        notification.save(update_fields=[flag])
+        return
+    
+    if outcome == DELIVER:
+        logger.debug("DELIVERING notification %s", notification.id)
+        _deliver_notification(notification)
+    
+def _push_notification(notification, unread_count=None):
+    """Send a notification to its recipient's WebSocket group; True if it went out"""
+    if unread_count is None:
+        unread_count = get_unread_notification_count(notification.user_id)
+    try:
+        _group_send(
+            f'notifications_{notification.user_id}',
             {
                 'type': 'notification_message',
                 'message': notification.message,
-                'count': Notification.objects.filter(user=notification.user, is_read=False).count(),
+                'count': unread_count,
                 'priority': notification.priority
             }
         )
-        
+        return True
+    except Exception as e:
+        # Log the error; the notification row is already stored and nothing changed
+        logger.error(f"Error sending notification: {str(e)}")
+        return False
+
+def _deliver_notification(notification):
+    """Helper function to deliver a notification via WebSocket"""
+    if not _push_notification(notification):
+        return
+    try:
         # Save notification as sent
         notification.is_sent = True
-        notification.save()
-        logger.info(f"Notification {notification.id} delivered successfully")
+        notification.save(update_fields=['is_sent'])
+        logger.debug("Notification %s delivered successfully", notification.id)
     except Exception as e:
-        # Log the error and still save the notification
         logger.error(f"Error sending notification: {str(e)}")
-        notification.save()
 
-def is_user_mentioned(message, user):
-    """Check if a user is mentioned in a message using @ notation"""
-    if not message or not user:
+def _channel_layer_is_shared():
+    """True when the configured channel layer reaches sockets held by other processes"""
+    return settings.CHANNEL_LAYERS['default']['BACKEND'] != 'channels.layers.InMemoryChannelLayer'
+
+def _dispatch_on_commit(notification_ids):
+    """Hand delivery to a Celery worker once the surrounding transaction commits"""
+    def enqueue():
+        from .tasks import dispatch_notifications
+        if not _channel_layer_is_shared():
+            # An in-memory layer only reaches this process's sockets; a worker's push would be lost
+            dispatch_notifications(notification_ids)
+            return
+        try:
+            dispatch_notifications.delay(notification_ids)
+        except Exception as e:
+            # No broker available (e.g. local development): deliver in-process instead
+            logger.warning("Could not queue notification dispatch, sending inline: %s", e)
+            dispatch_notifications(notification_ids)
+    transaction.on_commit(enqueue)
+
+def _notify_users(user_ids, **notification_fields):
+    """
+    Bulk-create one notification per user with its filter flags already set,
+    and queue only the deliverable ones.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    snapshots = get_preferences_snapshots(user_ids)
+    now = timezone.localtime()
+    
+    notifications = []
+    deliverable = []
+    for user_id in user_ids:
+        notification = Notification(user_id=user_id, **notification_fields)
+        outcome = _resolve_outcome(notification, snapshots.get(user_id), now=now)
+        flag = _OUTCOME_FLAGS.get(outcome)
+        if flag:
+            setattr(notification, flag, True)
+        elif outcome == DELIVER:
+            deliverable.append(notification)
+        notifications.append(notification)
+    
+    Notification.objects.bulk_create(notifications)
+    # bulk_create skips post_save, so bump the unread counters here
+    for notification in notifications:
+        adjust_unread_notification_count(notification.user_id, 1)
+    if deliverable:
+        _dispatch_on_commit([notification.id for notification in deliverable])
+
+def is_user_mentioned(message, mention_token):
+    """Check if a message contains a user's precomputed @username mention token"""
+    if not message or not mention_token:
         return False
-    return f"@{user.username}" in message
+    return mention_token in message
 
 @receiver(post_save, sender=Message)
 def create_message_notification(sender, instance, created, **kwargs):
@@ -196,29 +245,31 @@ def create_message_notification(sender, instance, created, **kwargs):
         if instance.thread is not None:
             return
         
+        # Skip scheduled messages - ScheduledMessage notifies their recipients itself
+        if instance.is_scheduled:
+            return
+        
         # Skip notifications for direct chat messages - these are handled by the ChatConsumer
         # Check if the is_from_websocket flag is set (we'll add logic to set this in consumers.py)
         if hasattr(instance, 'is_from_websocket') and instance.is_from_websocket:
             return
             
         # Get the owner if not the message sender
-        recipients = set()
-        if instance.work_item.owner.id != instance.user.id:
-            recipients.add(instance.work_item.owner)
+        recipient_ids = set()
+        if instance.work_item.owner_id != instance.user_id:
+            recipient_ids.add(instance.work_item.owner_id)
         
         # Add all collaborators except the message sender
-        collaborators = instance.work_item.collaborators.exclude(id=instance.user.id)
-        recipients.update(collaborators)
+        collaborator_ids = instance.work_item.collaborators.exclude(id=instance.user_id).values_list('id', flat=True)
+        recipient_ids.update(collaborator_ids)
 
-        for user in recipients:
-            notification = Notification.objects.create(
-                user=user,
-                message=f"New message from {instance.user.username} in '{instance.work_item.title}'",
-                work_item=instance.work_item,
-                thread=instance.thread,  # This will be None for non-threaded messages
-                notification_type='message'
-            )
-            send_notification(notification)
+        _notify_users(
+            recipient_ids,
+            message=f"New message from {instance.user.username} in '{instance.work_item.title}'",
+            work_item=instance.work_item,
+            thread=instance.thread,  # This will be None for non-threaded messages
+            notification_type='message'
+        )
 
 # When a work item is updated
 @receiver(post_save, sender=WorkItem)
@@ -226,37 +277,45 @@ def create_workitem_update_notification(sender, instance, created, **kwargs):
     # Skip notifications on creation or if there's no updated_by user
     if not created and hasattr(instance, 'updated_by') and instance.updated_by:
         # Get all users associated with this work item except the one who made the update
-        users = User.objects.filter(work_item=instance).exclude(id=instance.updated_by.id).distinct()
+        recipient_ids = {instance.owner_id}
+        recipient_ids.update(instance.collaborators.values_list('id', flat=True))
+        recipient_ids.discard(instance.updated_by.id)
         
-        for user in users:
-            notification = Notification.objects.create(
-                user=user,
-                message=f"'{instance.title}' was updated by {instance.updated_by.username}",
-                work_item=instance,
-                notification_type='update'
-            )
-            send_notification(notification)
+        _notify_users(
+            recipient_ids,
+            message=f"'{instance.title}' was updated by {instance.updated_by.username}",
+            work_item=instance,
+            notification_type='update'
+        )
 
 @receiver(post_save, sender=FileAttachment)
 def create_file_upload_notification(sender, instance, created, **kwargs):
     if created:
         # Get the owner if not the uploader
-        recipients = set()
-        if instance.work_item.owner.id != instance.uploaded_by.id:
-            recipients.add(instance.work_item.owner)
+        recipient_ids = set()
+        if instance.work_item.owner_id != instance.uploaded_by_id:
+            recipient_ids.add(instance.work_item.owner_id)
         
         # Add all collaborators except the uploader
-        collaborators = instance.work_item.collaborators.exclude(id=instance.uploaded_by.id)
-        recipients.update(collaborators)
+        collaborator_ids = instance.work_item.collaborators.exclude(id=instance.uploaded_by_id).values_list('id', flat=True)
+        recipient_ids.update(collaborator_ids)
 
-        for user in recipients:
-            notification = Notification.objects.create(
-                user=user,
-                message=f"{instance.uploaded_by.username} uploaded '{instance.name}' to '{instance.work_item.title}'",
-                work_item=instance.work_item,
-                notification_type='file_upload'
-            )
-            send_notification(notification)
+        _notify_users(
+            recipient_ids,
+            message=f"{instance.uploaded_by.username} uploaded '{instance.name}' to '{instance.work_item.title}'",
+            work_item=instance.work_item,
+            notification_type='file_upload'
+        )
+
+@receiver(post_save, sender=Notification)
+def count_new_unread_notification(sender, instance, created, **kwargs):
+    """Keep the cached unread counter in step with newly created notifications"""
+    if created and not instance.is_read:
+        adjust_unread_notification_count(instance.user_id, 1)
+
+@receiver(post_delete, sender=Notification)
+def invalidate_unread_count_on_delete(sender, instance, **kwargs):
+    invalidate_unread_notification_counts([instance.user_id])
 
 @receiver(post_save, sender=User)
 def create_notification_preferences(sender, instance, created, **kwargs):
@@ -265,9 +324,38 @@ def create_notification_preferences(sender, instance, created, **kwargs):
         NotificationPreference.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_notification_preferences(sender, instance, **kwargs):
-    """Save notification preferences when user is saved"""
-    try:
-        instance.notification_preferences.save()
-    except NotificationPreference.DoesNotExist:
-        NotificationPreference.objects.create(user=instance)
\ No newline at end of file
+def invalidate_cached_mention_token(sender, instance, created, update_fields=None, **kwargs):
+    """Snapshots carry the @username mention token, so drop them when a username may have changed"""
+    if not created and (update_fields is None or 'username' in update_fields):
+        invalidate_preferences_snapshots([instance.id])
+
+@receiver(post_save, sender=NotificationPreference)
+@receiver(post_delete, sender=NotificationPreference)
+def invalidate_cached_preferences(sender, instance, **kwargs):
+    """Drop the cached preferences snapshot whenever preferences change"""
+    invalidate_preferences_snapshots([instance.user_id])
+
+@receiver(m2m_changed, sender=NotificationPreference.muted_channels.through)
+@receiver(m2m_changed, sender=NotificationPreference.muted_threads.through)
+@receiver(m2m_changed, sender=NotificationPreference.focus_work_items.through)
+@receiver(m2m_changed, sender=NotificationPreference.focus_users.through)
+def invalidate_cached_preference_lists(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop cached snapshots when muted or focus lists are edited"""
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_preferences_snapshots([instance.user_id])
+        return
+    
+    # Edited from the WorkItem/Thread/User side: find the affected preferences
+    if action == 'pre_clear':
+        # pk_set isn't provided for clear(), so look the owners up before the rows go
+        field_name = next(
+            field.name for field in NotificationPreference._meta.many_to_many
+            if field.remote_field.through is sender
+        )
+        preferences = NotificationPreference.objects.filter(**{field_name: instance})
+    elif action in ('post_add', 'post_remove') and pk_set:
+        preferences = NotificationPreference.objects.filter(id__in=pk_set)
+    else:
+        return
+    invalidate_preferences_snapshots(preferences.values_list('user_id', flat=True))
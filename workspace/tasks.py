@@ -1,52 +1,137 @@
-from celery import shared_task
+from celery import shared_task, group
+from django.db import transaction
 from django.utils import timezone
-from .models import ScheduledMessage, Message, SlowChannelMessage
+from .models import ScheduledMessage, Message, SlowChannelMessage, Notification
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Number of due rows handled by each batch task
+DELIVERY_BATCH_SIZE = 100
+
+@shared_task
+def dispatch_notifications(notification_ids):
+    """Push notifications that already passed preference filtering over WebSocket"""
+    from .signals import _push_notification
+    from .utils import get_unread_notification_counts
+    
+    notifications = list(Notification.objects.filter(id__in=notification_ids, is_sent=False))
+    # The batch is already stored, so one count per recipient covers every push
+    unread_counts = get_unread_notification_counts(notification.user_id for notification in notifications)
+    sent_ids = [
+        notification.id for notification in notifications
+        if _push_notification(notification, unread_counts[notification.user_id])
+    ]
+    
+    # Flag the whole batch as sent with one UPDATE instead of a save per notification
+    if sent_ids:
+        Notification.objects.filter(id__in=sent_ids).update(is_sent=True)
+    return {'status': 'success', 'dispatched': len(sent_ids)}
+
+def _chunked(ids, size):
+    """Split a list of ids into consecutive batches of at most size ids"""
+    return [ids[start:start + size] for start in range(0, len(ids), size)]
+
+def _fan_out(batch_task, ids):
+    """Run a single batch in this worker, or spread several batches across workers"""
+    batches = _chunked(ids, DELIVERY_BATCH_SIZE)
+    if len(batches) == 1:
+        return batch_task(batches[0])
+    group(batch_task.s(batch) for batch in batches).apply_async()
+    return {'status': 'queued', 'batches': len(batches)}
+
 @shared_task
 def send_scheduled_messages():
     """Task to send scheduled messages that are due"""
     now = timezone.now()
     
-    # Get all unsent messages that are due
-    due_messages = ScheduledMessage.objects.filter(
-        is_sent=False,
-        scheduled_time__lte=now
+    # Only read the ids here; the batch tasks load the rows they lock
+    due_ids = list(
+        ScheduledMessage.objects.filter(
+            is_sent=False,
+            scheduled_time__lte=now
+        ).values_list('id', flat=True)
     )
     
-    if not due_messages.exists():
+    if not due_ids:
         logger.info('No scheduled messages are due')
         return {'status': 'success', 'sent': 0, 'failed': 0}
     
-    logger.info(f'Found {due_messages.count()} scheduled messages to send')
-    
-    # Keep track of successes and failures
-    success_count = 0
+    logger.info(f'Found {len(due_ids)} scheduled messages to send')
+    return _fan_out(send_scheduled_message_batch, due_ids)
+
+def _send_scheduled_messages_individually(scheduled_message_ids, now):
+    """Send each message in its own savepoint so one bad row can't hold back the rest"""
+    sent_count = 0
     fail_count = 0
-    
-    # Process each message
-    for scheduled_msg in due_messages:
+    for scheduled_message_id in scheduled_message_ids:
         try:
-            # Send the message
-            message = scheduled_msg.send()
-            
-            if message:
-                success_count += 1
-                logger.info(f'Sent scheduled message #{scheduled_msg.id} from {scheduled_msg.sender.username}')
-            else:
-                fail_count += 1
-                logger.error(f'Failed to send scheduled message #{scheduled_msg.id}')
+            with transaction.atomic():
+                scheduled_msg = (
+                    ScheduledMessage.objects.select_related('work_item', 'thread', 'sender', 'parent_message')
+                    .select_for_update(skip_locked=True, of=('self',))
+                    .filter(id=scheduled_message_id, is_sent=False)
+                    .first()
+                )
+                if scheduled_msg is None:
+                    continue
+                message = scheduled_msg.build_message()
+                message.save()
+                ScheduledMessage.objects.filter(id=scheduled_msg.id).update(is_sent=True, sent_at=now)
         except Exception as e:
             fail_count += 1
-            logger.error(f'Error sending scheduled message #{scheduled_msg.id}: {str(e)}')
+            logger.error(f'Error sending scheduled message #{scheduled_message_id}: {str(e)}')
+            continue
+        
+        scheduled_msg._create_notifications(message)
+        sent_count += 1
+    
+    logger.info(f'Sent {sent_count} scheduled messages one at a time, {fail_count} failed')
+    return {
+        'status': 'error' if fail_count else 'success',
+        'sent': sent_count,
+        'failed': fail_count
+    }
+
+@shared_task
+def send_scheduled_message_batch(scheduled_message_ids):
+    """Send one batch of scheduled messages"""
+    now = timezone.now()
+    
+    try:
+        # Lock the rows so overlapping batches can't send a message twice
+        with transaction.atomic():
+            due_messages = list(
+                ScheduledMessage.objects.select_related('work_item', 'thread', 'sender', 'parent_message')
+                .select_for_update(skip_locked=True, of=('self',))
+                .filter(id__in=scheduled_message_ids, is_sent=False)
+            )
+            if not due_messages:
+                return {'status': 'success', 'sent': 0, 'failed': 0}
+            
+            # Insert all the messages and flag the schedule rows in one go
+            messages = Message.objects.bulk_create(
+                [scheduled_msg.build_message() for scheduled_msg in due_messages]
+            )
+            ScheduledMessage.objects.filter(
+                id__in=[scheduled_msg.id for scheduled_msg in due_messages]
+            ).update(is_sent=True, sent_at=now)
+    except Exception as e:
+        # The batch rolled back as a whole; retry row by row so only the bad rows fail
+        logger.error(f'Error sending {len(scheduled_message_ids)} scheduled messages in one batch: {str(e)}')
+        return _send_scheduled_messages_individually(scheduled_message_ids, now)
+    
+    # bulk_create skips post_save, so fan out the notifications explicitly
+    for scheduled_msg, message in zip(due_messages, messages):
+        scheduled_msg._create_notifications(message)
+    
+    logger.info(f'Sent {len(messages)} scheduled messages')
     
     # Return summary
     return {
         'status': 'success', 
-        'sent': success_count, 
-        'failed': fail_count
+        'sent': len(messages), 
+        'failed': 0
     }
 
 @shared_task
@@ -54,44 +139,65 @@ def deliver_slow_channel_messages():
     """Task to deliver scheduled slow channel messages"""
     now = timezone.now()
     
-    # Get all undelivered messages that are due
-    due_messages = SlowChannelMessage.objects.filter(
-        is_delivered=False,
-        scheduled_delivery__lte=now
+    # Only read the ids here; the batch tasks load the rows they lock
+    due_ids = list(
+        SlowChannelMessage.objects.filter(
+            is_delivered=False,
+            scheduled_delivery__lte=now
+        ).values_list('id', flat=True)
     )
     
-    if not due_messages.exists():
+    if not due_ids:
         logger.info('No slow channel messages are due for delivery')
         return {'status': 'success', 'delivered': 0, 'failed': 0}
         
-    logger.info(f'Found {due_messages.count()} slow channel messages to deliver')
-    
-    # Keep track of successes and failures
-    success_count = 0
-    fail_count = 0
+    logger.info(f'Found {len(due_ids)} slow channel messages to deliver')
+    return _fan_out(deliver_slow_channel_message_batch, due_ids)
+
+@shared_task
+def deliver_slow_channel_message_batch(message_ids):
+    """Deliver one batch of slow channel messages"""
+    now = timezone.now()
     
-    # Process each message
-    for message in due_messages:
-        try:
-            message.deliver()
-            success_count += 1
-            logger.info(
-                f'Delivered slow channel message #{message.id} from {message.user.username} '
-                f'in channel "{message.channel.title}"'
-            )
-        except Exception as e:
-            fail_count += 1
-            logger.error(f'Error delivering slow channel message #{message.id}: {str(e)}')
+    # Lock the batch (not the joined rows); rows held by another worker are skipped
+    with transaction.atomic():
+        due_messages = list(
+            SlowChannelMessage.objects.select_related('user', 'channel', 'channel__work_item')
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(id__in=message_ids, is_delivered=False)
+        )
+        
+        # Keep track of successes and failures
+        delivered_ids = []
+        fail_count = 0
+        
+        # Notify participants for each message
+        for message in due_messages:
+            try:
+                # One savepoint per message, so a failure only rolls back that message's notifications
+                with transaction.atomic():
+                    message.notify_participants()
+                delivered_ids.append(message.id)
+                logger.info(
+                    f'Delivered slow channel message #{message.id} from {message.user.username} '
+                    f'in channel "{message.channel.title}"'
+                )
+            except Exception as e:
+                fail_count += 1
+                logger.error(f'Error delivering slow channel message #{message.id}: {str(e)}')
+        
+        # Flag every delivered message with one UPDATE
+        SlowChannelMessage.objects.filter(id__in=delivered_ids).update(is_delivered=True, delivered_at=now)
             
     # Summary
     logger.info(
-        f'Processed {due_messages.count()} slow channel messages: '
-        f'{success_count} delivered successfully, {fail_count} failed'
+        f'Processed {len(due_messages)} slow channel messages: '
+        f'{len(delivered_ids)} delivered successfully, {fail_count} failed'
     )
     
     return {
         'status': 'success',
-        'delivered': success_count,
+        'delivered': len(delivered_ids),
         'failed': fail_count
     }
 
@@ -1,54 +1,72 @@
-from django.test import TestCase, Client, RequestFactory
+"""
+Tests for the workspace app.
+
+Most TestCase classes build their fixtures once in setUpTestData. Django
+rolls back database writes after each test and hands every test a fresh copy
+of the class attributes, but the cache is not rolled back, so classes that
+read cached preferences or unread counts clear it in setUp.
+"""
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
-from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
-from django.db.models import Q
-from django.http import JsonResponse
-from django.contrib.sessions.models import Session
-from django.contrib.messages import get_messages
-from unittest.mock import patch, MagicMock, call, ANY
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from unittest.mock import patch, MagicMock
 import unittest
 import datetime
 import json
-import inspect
-import asyncio
-from workspace.consumers import ChatConsumer
+from io import StringIO
 from workspace.signals import send_notification
 
 from workspace.models import (
-    WorkItem, Message, Thread, ThreadGroup, FileAttachment, Notification, NotificationPreference,
+    WorkItem, Message, Thread, Notification, NotificationPreference,
     MessageReadReceipt, SlowChannel, SlowChannelMessage, ScheduledMessage, BreakEvent,
-    ThreadMessage, UserOnlineStatus
-)
-from workspace.forms import (
-    WorkItemForm, MessageForm, FileAttachmentForm, NotificationPreferenceForm, 
-    ThreadForm, ScheduledMessageForm, SlowChannelForm, SlowChannelMessageForm
-)
-from workspace.views import (
-    dashboard, work_item_detail, create_work_item, update_work_item, delete_work_item,
-    thread_detail, create_thread, update_thread, upload_file, notifications_list,
-    mark_notification_read, mark_all_read, notification_preferences,
-    schedule_message, my_scheduled_messages, mark_message_read, get_message_read_status,
-    slow_channel_detail, create_slow_channel, update_slow_channel
+    UserOnlineStatus
 )
+from workspace.views import mark_message_read, get_message_read_status
+
+
+class ModelStringRepresentationTests(SimpleTestCase):
+    """Tests for model __str__ methods; unsaved instances, so no database is needed"""
+    
+    def setUp(self):
+        self.user = User(username='testuser')
+    
+    def test_work_item_string_representation(self):
+        """Test that a work item is shown by its title"""
+        work_item = WorkItem(title='Test Work Item', owner=self.user)
+        self.assertEqual(str(work_item), 'Test Work Item')
+    
+    def test_message_string_representation(self):
+        """Test that a message is shown as author and content"""
+        message = Message(user=self.user, content='Test message content')
+        self.assertEqual(str(message), 'testuser: Test message content')
+    
+    def test_notification_string_representation(self):
+        """Test that a notification is shown with its recipient and a truncated message"""
+        notification = Notification(user=self.user, message='A' * 40)
+        self.assertEqual(str(notification), f"Notification for testuser: {'A' * 30}")
 
 
 class BreakEventModelTests(TestCase):
     """Tests for BreakEvent model"""
     
-    def setUp(self):
-        """Set up test data"""
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data once for the class"""
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpassword'
         )
         
-        self.start_time = timezone.now() - datetime.timedelta(minutes=15)
-        self.break_event = BreakEvent.objects.create(
-            user=self.user,
-            start_time=self.start_time
+        cls.start_time = timezone.now() - datetime.timedelta(minutes=15)
+        cls.break_event = BreakEvent.objects.create(
+            user=cls.user,
+            start_time=cls.start_time
         )
     
     def test_break_event_creation(self):
@@ -77,37 +95,45 @@ class BreakEventModelTests(TestCase):
 class MessageReadReceiptModelTests(TestCase):
     """Tests for MessageReadReceipt model"""
     
-    def setUp(self):
-        """Set up test data"""
-        self.sender = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data once for the class"""
+        cls.sender = User.objects.create_user(
             username='sender',
             email='sender@example.com',
             password='senderpassword'
         )
         
-        self.reader = User.objects.create_user(
+        cls.reader = User.objects.create_user(
             username='reader',
             email='reader@example.com',
             password='readerpassword'
         )
         
-        self.work_item = WorkItem.objects.create(
+        # A third reader for the ordering test
+        cls.another = User.objects.create_user(
+            username='another',
+            email='another@example.com',
+            password='anotherpass'
+        )
+        
+        cls.work_item = WorkItem.objects.create(
             title='Test Work Item',
             description='This is a test work item',
             type='task',
-            owner=self.sender
+            owner=cls.sender
         )
-        self.work_item.collaborators.add(self.reader)
+        cls.work_item.collaborators.add(cls.reader)
         
-        self.message = Message.objects.create(
-            work_item=self.work_item,
-            user=self.sender,
+        cls.message = Message.objects.create(
+            work_item=cls.work_item,
+            user=cls.sender,
             content='Test message'
         )
         
-        self.read_receipt = MessageReadReceipt.objects.create(
-            message=self.message,
-            user=self.reader,
+        cls.read_receipt = MessageReadReceipt.objects.create(
+            message=cls.message,
+            user=cls.reader,
             read_duration=datetime.timedelta(seconds=30)
         )
     
@@ -125,29 +151,27 @@ class MessageReadReceiptModelTests(TestCase):
     
     def test_read_receipt_ordering(self):
         """Test that read receipts are ordered by read_at (oldest first)"""
-        # Create a second read receipt with older time
-        older_time = timezone.now() - datetime.timedelta(hours=1)
-        older_receipt = MessageReadReceipt.objects.create(
-            message=self.message,
-            user=self.sender,  # Using sender as another reader for test purposes
-            read_duration=datetime.timedelta(seconds=15)
-        )
-        # Update the read_at to an older time
-        MessageReadReceipt.objects.filter(pk=older_receipt.pk).update(read_at=older_time)
+        # Insert one receipt to backdate and one newer than the fixture together
+        older_receipt, newer_receipt = MessageReadReceipt.objects.bulk_create([
+            MessageReadReceipt(
+                message=self.message,
+                user=self.sender,  # Using sender as another reader for test purposes
+                read_duration=datetime.timedelta(seconds=15)
+            ),
+            MessageReadReceipt(message=self.message, user=self.another),
+        ])
         
-        # Create a third read receipt with newer time
-        newer_receipt = MessageReadReceipt.objects.create(
-            message=self.message,
-            user=User.objects.create_user('another', 'another@example.com', 'anotherpass')
-        )
+        # read_at is auto_now_add, so the insert stamps it; bulk_update writes the values as given
+        now = timezone.now()
+        older_receipt.read_at = now - datetime.timedelta(hours=1)
+        newer_receipt.read_at = now + datetime.timedelta(seconds=1)
+        MessageReadReceipt.objects.bulk_update([older_receipt, newer_receipt], ['read_at'])
         
-        # Get receipts ordered by default ordering
-        receipts = MessageReadReceipt.objects.filter(message=self.message)
+        # Get receipts ordered by default ordering, fetched in one query
+        receipts = list(MessageReadReceipt.objects.filter(message=self.message))
         
         # Should be ordered by read_at (oldest first)
-        self.assertEqual(receipts[0], older_receipt)
-        self.assertEqual(receipts[1], self.read_receipt)
-        self.assertEqual(receipts[2], newer_receipt)
+        self.assertEqual(receipts, [older_receipt, self.read_receipt, newer_receipt])
     
     def test_read_receipt_unique_constraint(self):
         """Test that a user can only have one read receipt per message"""
@@ -160,37 +184,38 @@ class MessageReadReceiptModelTests(TestCase):
 class FocusModeTestCase(TestCase):
     """A standalone test case specifically for focus mode filtering"""
     
-    def setUp(self):
-        """Set up test data"""
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data once for the class"""
+        cls.user = User.objects.create_user(
             username='focususer',
             email='focus@example.com',
             password='testpassword'
         )
         
-        self.work_item = WorkItem.objects.create(
+        cls.work_item = WorkItem.objects.create(
             title='Test Work Item',
             description='This is a test work item',
             type='task',
-            owner=self.user
+            owner=cls.user
         )
         
         # Get the existing notification preference that was created by the signal
-        self.notification_pref = NotificationPreference.objects.get(user=self.user)
+        cls.notification_pref = NotificationPreference.objects.get(user=cls.user)
         
         # Update it to enable focus mode
-        self.notification_pref.focus_mode = True
-        self.notification_pref.save()
+        cls.notification_pref.focus_mode = True
+        cls.notification_pref.save(update_fields=['focus_mode'])
         
         # Create a focus work item
-        self.focus_work_item = WorkItem.objects.create(
+        cls.focus_work_item = WorkItem.objects.create(
             title='Focus Work Item',
             type='task',
-            owner=self.user
+            owner=cls.user
         )
         
         # Add to focus list
-        self.notification_pref.focus_work_items.add(self.focus_work_item)
+        cls.notification_pref.focus_work_items.add(cls.focus_work_item)
     
     def test_focus_mode_filtering(self):
         """Test that notifications are filtered when in focus mode"""
@@ -231,14 +256,14 @@ class FocusModeTestCase(TestCase):
             print(f"Non-focus work item ID: {non_focus.id}")
             
             # Force a refresh of notification preferences to ensure focus mode is enabled
-            self.notification_pref.refresh_from_db()
+            self.notification_pref.refresh_from_db(fields=['focus_mode'])
             print(f"Double check focus mode: {self.notification_pref.focus_mode}")
             
             # Call the function
             workspace.signals.send_notification(notification)
             
             # Refresh from database
-            notification.refresh_from_db()
+            notification.refresh_from_db(fields=['is_focus_filtered'])
             
             # Debug state after call
             print(f"is_focus_filtered: {notification.is_focus_filtered}")
@@ -257,16 +282,17 @@ class FocusModeTestCase(TestCase):
 class UserOnlineStatusTests(TestCase):
     """Tests for UserOnlineStatus model"""
     
-    def setUp(self):
-        """Set up test data"""
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data once for the class"""
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpassword'
         )
         
-        self.status = UserOnlineStatus.objects.create(
-            user=self.user,
+        cls.status = UserOnlineStatus.objects.create(
+            user=cls.user,
             status='online',
             status_message='Working on tests'
         )
@@ -302,72 +328,68 @@ class UserOnlineStatusTests(TestCase):
 class ReadReceiptViewTests(TestCase):
     """Tests for read receipt views"""
     
-    def setUp(self):
-        """Set up test data and client"""
-        self.client = Client()
-        
-        self.sender = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data and URLs once for the class"""
+        cls.sender = User.objects.create_user(
             username='sender',
             email='sender@example.com',
             password='senderpassword'
         )
         
-        self.reader = User.objects.create_user(
+        cls.reader = User.objects.create_user(
             username='reader',
             email='reader@example.com',
             password='readerpassword'
         )
         
-        self.work_item = WorkItem.objects.create(
+        cls.work_item = WorkItem.objects.create(
             title='Test Work Item',
             description='This is a test work item',
             type='task',
-            owner=self.sender
+            owner=cls.sender
         )
-        self.work_item.collaborators.add(self.reader)
+        cls.work_item.collaborators.add(cls.reader)
         
-        self.message = Message.objects.create(
-            work_item=self.work_item,
-            user=self.sender,
+        cls.message = Message.objects.create(
+            work_item=cls.work_item,
+            user=cls.sender,
             content='Test message'
         )
         
-        self.thread = Thread.objects.create(
+        cls.thread = Thread.objects.create(
             title='Test Thread',
-            work_item=self.work_item,
-            created_by=self.sender,
+            work_item=cls.work_item,
+            created_by=cls.sender,
             is_public=True
         )
         
-        self.thread_message = Message.objects.create(
-            work_item=self.work_item,
-            thread=self.thread,
-            user=self.sender,
+        cls.thread_message = Message.objects.create(
+            work_item=cls.work_item,
+            thread=cls.thread,
+            user=cls.sender,
             content='Test thread message'
         )
         
-        self.notification_pref, created = NotificationPreference.objects.get_or_create(
-        user=self.reader,
-        defaults={
-            'share_read_receipts': True
-        }
-    )
+        # The reader's default preferences come from the post_save signal and share read receipts
+        cls.notification_pref = cls.reader.notification_preferences
+        
+        # URLs only depend on the class fixtures, so resolve them once
+        cls.mark_read_url = reverse('mark_message_read', args=[cls.message.pk])
+        cls.get_read_status_url = reverse('get_message_read_status', args=[cls.message.pk])
+        cls.mark_thread_read_url = reverse('mark_thread_read', args=[cls.thread.pk])
     
-    # If it already existed, update it
-        if not created:
-            self.notification_pref.share_read_receipts = True
-            self.notification_pref.save()
-        
-        # URLs
-        self.mark_read_url = reverse('mark_message_read', args=[self.message.pk])
-        self.get_read_status_url = reverse('get_message_read_status', args=[self.message.pk])
-        self.mark_thread_read_url = reverse('mark_thread_read', args=[self.thread.pk])
+    def setUp(self):
+        # The message views only read request.user, so call them directly
+        # instead of going through the session and middleware stack
+        self.factory = RequestFactory()
     
     def test_mark_message_read_view(self):
         """Test marking a message as read"""
-        self.client.login(username='reader', password='readerpassword')
+        request = self.factory.post(self.mark_read_url)
+        request.user = self.reader
         
-        response = self.client.post(self.mark_read_url)
+        response = mark_message_read(request, message_id=self.message.pk)
         
         # Should return success JSON
         self.assertEqual(response.status_code, 200)
@@ -384,9 +406,10 @@ class ReadReceiptViewTests(TestCase):
 
     def test_mark_message_read_view_own_message(self):
         """Test marking your own message as read (should be skipped)"""
-        self.client.login(username='sender', password='senderpassword')
+        request = self.factory.post(self.mark_read_url)
+        request.user = self.sender
         
-        response = self.client.post(self.mark_read_url)
+        response = mark_message_read(request, message_id=self.message.pk)
         
         # Should return success JSON
         self.assertEqual(response.status_code, 200)
@@ -405,13 +428,13 @@ class ReadReceiptViewTests(TestCase):
     def test_mark_message_read_view_receipts_disabled(self):
         """Test marking a message as read when read receipts are disabled"""
         # Disable read receipts for reader
-        prefs = NotificationPreference.objects.get(user=self.reader)
-        prefs.share_read_receipts = False
-        prefs.save()
+        self.notification_pref.share_read_receipts = False
+        self.notification_pref.save(update_fields=['share_read_receipts'])
         
-        self.client.login(username='reader', password='readerpassword')
+        request = self.factory.post(self.mark_read_url)
+        request.user = self.reader
         
-        response = self.client.post(self.mark_read_url)
+        response = mark_message_read(request, message_id=self.message.pk)
         
         # Should return success JSON
         self.assertEqual(response.status_code, 200)
@@ -427,10 +450,12 @@ class ReadReceiptViewTests(TestCase):
             user=self.reader
         )
         
-        # Log in as the message author
-        self.client.login(username='sender', password='senderpassword')
+        # Ask as the message author
+        request = self.factory.get(self.get_read_status_url)
+        request.user = self.sender
         
-        response = self.client.get(self.get_read_status_url)
+        with self.assertNumQueries(4):
+            response = get_message_read_status(request, message_id=self.message.pk)
         
         # Should return success JSON with read info
         self.assertEqual(response.status_code, 200)
@@ -444,11 +469,31 @@ class ReadReceiptViewTests(TestCase):
         # Should include total counts
         self.assertEqual(data['total_read'], 1)
     
+    def test_get_message_read_status_view_query_count_with_many_receipts(self):
+        """Test that each receipt's reader is loaded with the receipts, not one query per reader"""
+        for index in range(5):
+            reader = User.objects.create_user(
+                username=f'reader{index}',
+                email=f'reader{index}@example.com',
+                password='readerpassword'
+            )
+            MessageReadReceipt.objects.create(message=self.message, user=reader)
+        
+        request = self.factory.get(self.get_read_status_url)
+        request.user = self.sender
+        
+        with self.assertNumQueries(4):
+            response = get_message_read_status(request, message_id=self.message.pk)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['total_read'], 5)
+    
     def test_get_message_read_status_view_not_author(self):
         """Test that only the author can get read status"""
-        self.client.login(username='reader', password='readerpassword')
+        request = self.factory.get(self.get_read_status_url)
+        request.user = self.reader
         
-        response = self.client.get(self.get_read_status_url)
+        response = get_message_read_status(request, message_id=self.message.pk)
         
         # Should return error JSON
         self.assertEqual(response.status_code, 403)
@@ -465,9 +510,11 @@ class ReadReceiptViewTests(TestCase):
             content='Second thread message'
         )
         
-        self.client.login(username='reader', password='readerpassword')
+        self.client.force_login(self.reader)
         
-        response = self.client.post(self.mark_thread_read_url)
+        # Receipts for every unread message go in with a single INSERT
+        with self.assertNumQueries(6):
+            response = self.client.post(self.mark_thread_read_url)
         
         # Should return success JSON
         self.assertEqual(response.status_code, 200)
@@ -490,122 +537,135 @@ class ReadReceiptViewTests(TestCase):
         )
 
 
-class WebSocketConsumerTests(TestCase):
-    """Tests for WebSocket consumers"""
+class DashboardViewTests(TestCase):
+    """Tests for the dashboard view"""
     
-    def setUp(self):
-        """Set up test data"""
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """Set up work items the user owns and collaborates on"""
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpassword'
         )
-        
-        self.collaborator = User.objects.create_user(
-            username='collaborator',
-            email='collab@example.com',
-            password='collabpassword'
+        cls.other_user = User.objects.create_user(
+            username='otheruser',
+            email='other@example.com',
+            password='otherpassword'
         )
         
-        self.work_item = WorkItem.objects.create(
-            title='Test Work Item',
-            description='This is a test work item',
+        cls.owned_item = WorkItem.objects.create(
+            title='Owned Work Item',
+            description='Owned by the test user',
             type='task',
-            owner=self.user
+            owner=cls.user
         )
-        self.work_item.collaborators.add(self.collaborator)
-        
-        self.thread = Thread.objects.create(
-            title='Test Thread',
-            work_item=self.work_item,
-            created_by=self.user,
-            is_public=True
+        cls.shared_item = WorkItem.objects.create(
+            title='Shared Work Item',
+            description='Owned by another user',
+            type='project',
+            owner=cls.other_user
         )
+        cls.shared_item.collaborators.add(cls.user, cls.other_user)
+        
+        for content in ('First message', 'Second message'):
+            Message.objects.create(work_item=cls.owned_item, user=cls.user, content=content)
+        
+        cls.dashboard_url = reverse('dashboard')
     
-    def test_chat_consumer_connect(self):
-        """Test logic for ChatConsumer connect"""
-        # Simply pass the test for now
-        self.assertTrue(True)
-
-    def test_chat_consumer_receive(self):
-        """Test logic for ChatConsumer receive"""
-        # Simply pass the test for now
-        self.assertTrue(True)
-
-    def test_file_consumer_receive(self):
-        """Test logic for FileConsumer receive"""
-        # Simply pass the test for now
-        self.assertTrue(True)
+    def test_dashboard_lists_work_items_with_message_counts(self):
+        """Test the dashboard shows each accessible work item once with its message count"""
+        self.client.force_login(self.user)
+        
+        response = self.client.get(self.dashboard_url)
+        
+        self.assertEqual(response.status_code, 200)
+        work_items = {item.pk: item for item in response.context['work_items']}
+        self.assertEqual(set(work_items), {self.owned_item.pk, self.shared_item.pk})
+        self.assertEqual(work_items[self.owned_item.pk].message_count, 2)
+        self.assertEqual(work_items[self.shared_item.pk].message_count, 0)
+    
+    def test_dashboard_query_count_does_not_grow_with_work_items(self):
+        """Test owners and message counts are loaded with the work items, not per card"""
+        self.client.force_login(self.user)
+        
+        with self.assertNumQueries(6):
+            self.client.get(self.dashboard_url)
+        
+        for index in range(3):
+            WorkItem.objects.create(
+                title=f'Extra Work Item {index}',
+                description='Another item on the dashboard',
+                type='doc',
+                owner=self.other_user
+            ).collaborators.add(self.user)
+        
+        with self.assertNumQueries(6):
+            self.client.get(self.dashboard_url)
 
-    def test_thread_consumer_receive(self):
-        """Test logic for ThreadConsumer receive"""
-        # Simply pass the test for now
-        self.assertTrue(True)
 
-    def test_notification_consumer_notification_message(self):
-        """Test logic for NotificationConsumer notification_message"""
-        # Simply pass the test for now
-        self.assertTrue(True)
+class WebSocketConsumerTests(SimpleTestCase):
+    """Tests for WebSocket consumers"""
+    
+    @unittest.skip('Consumer tests not written yet')
+    def test_consumers(self):
+        """Placeholder for the ChatConsumer, FileConsumer, ThreadConsumer and NotificationConsumer tests"""
 
 
 class CeleryTaskTests(TestCase):
     """Tests for Celery tasks"""
     
-    def setUp(self):
-        """Set up test data"""
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data once for the whole class"""
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpassword'
         )
         
-        self.work_item = WorkItem.objects.create(
+        cls.work_item = WorkItem.objects.create(
             title='Test Work Item',
             description='This is a test work item',
             type='task',
-            owner=self.user
+            owner=cls.user
         )
         
         # Set scheduled time to be in the past
-        self.past_time = timezone.now() - datetime.timedelta(hours=1)
+        cls.past_time = timezone.now() - datetime.timedelta(hours=1)
         
-        self.scheduled_message = ScheduledMessage.objects.create(
-            sender=self.user,
-            work_item=self.work_item,
+        cls.scheduled_message = ScheduledMessage.objects.create(
+            sender=cls.user,
+            work_item=cls.work_item,
             content='This is a scheduled message',
-            scheduled_time=self.past_time,
+            scheduled_time=cls.past_time,
             is_sent=False
         )
         
         # Create a slow channel
-        self.slow_channel = SlowChannel.objects.create(
+        cls.slow_channel = SlowChannel.objects.create(
             title='Reflection Channel',
             description='For team reflections',
             type='reflection',
-            work_item=self.work_item,
-            created_by=self.user,
+            work_item=cls.work_item,
+            created_by=cls.user,
             message_frequency='daily'
         )
-        self.slow_channel.participants.add(self.user)
+        cls.slow_channel.participants.add(cls.user)
         
         # Create a slow channel message scheduled for delivery
-        self.sc_message = SlowChannelMessage.objects.create(
-            channel=self.slow_channel,
-            user=self.user,
+        cls.sc_message = SlowChannelMessage.objects.create(
+            channel=cls.slow_channel,
+            user=cls.user,
             content='This is a slow channel message',
-            scheduled_delivery=self.past_time,
+            scheduled_delivery=cls.past_time,
             is_delivered=False
         )
     
-    @patch('workspace.models.Message.objects.create')
-    def test_send_scheduled_messages_task(self, mock_create_message):
+    def test_send_scheduled_messages_task(self):
         """Test task to send scheduled messages"""
         from workspace.tasks import send_scheduled_messages
         
-        # Mock the created message
-        mock_message = MagicMock()
-        mock_create_message.return_value = mock_message
-        
         # Run the task
         result = send_scheduled_messages()
         
@@ -615,13 +675,76 @@ class CeleryTaskTests(TestCase):
         self.assertEqual(result['failed'], 0)
         
         # Message should be marked as sent
-        self.scheduled_message.refresh_from_db()
+        self.scheduled_message.refresh_from_db(fields=['is_sent', 'sent_at'])
         self.assertTrue(self.scheduled_message.is_sent)
         self.assertIsNotNone(self.scheduled_message.sent_at)
         
         # A Message should have been created
-        mock_create_message.assert_called_once()
+        message = Message.objects.get(is_scheduled=True)
+        self.assertEqual(message.content, 'This is a scheduled message')
+        self.assertEqual(message.user, self.user)
+    
+    @patch('workspace.signals._dispatch_on_commit')
+    def test_scheduled_message_send_notifies_each_recipient_once(self, mock_dispatch):
+        """Test that sending one scheduled message doesn't notify recipients from both send() and the Message signal"""
+        collaborator = User.objects.create_user('collab', 'collab@example.com', 'collabpass')
+        self.work_item.collaborators.add(collaborator)
+        
+        self.assertTrue(self.scheduled_message.send())
+        
+        notification = Notification.objects.get(user=collaborator)
+        self.assertEqual(notification.message, "testuser sent a scheduled message in 'Test Work Item'")
+        mock_dispatch.assert_called_once()
+    
+    @patch('workspace.signals._dispatch_on_commit')
+    def test_send_scheduled_message_batch_falls_back_to_single_rows(self, mock_dispatch):
+        """Test that a bad row only fails itself, and that the batch path uses the same text as send()"""
+        from workspace.tasks import send_scheduled_message_batch
+        
+        collaborator = User.objects.create_user('collab', 'collab@example.com', 'collabpass')
+        self.work_item.collaborators.add(collaborator)
+        bad_message = ScheduledMessage.objects.create(
+            sender=self.user,
+            work_item=self.work_item,
+            content='This one fails',
+            scheduled_time=self.past_time
+        )
+        
+        original_build = ScheduledMessage.build_message
+        def build_message(scheduled_msg):
+            if scheduled_msg.id == bad_message.id:
+                raise ValueError('Broken scheduled message')
+            return original_build(scheduled_msg)
+        
+        with patch.object(ScheduledMessage, 'build_message', autospec=True, side_effect=build_message):
+            result = send_scheduled_message_batch([self.scheduled_message.id, bad_message.id])
+        
+        self.assertEqual(result, {'status': 'error', 'sent': 1, 'failed': 1})
+        self.assertTrue(ScheduledMessage.objects.get(id=self.scheduled_message.id).is_sent)
+        self.assertFalse(ScheduledMessage.objects.get(id=bad_message.id).is_sent)
+        
+        notification = Notification.objects.get(user=collaborator)
+        self.assertEqual(notification.message, "testuser sent a scheduled message in 'Test Work Item'")
     
+    @patch('workspace.tasks.DELIVERY_BATCH_SIZE', 1)
+    @patch('workspace.tasks.group')
+    def test_send_scheduled_messages_fans_out_batches(self, mock_group):
+        """Test that due messages beyond one batch are spread across worker tasks"""
+        from workspace.tasks import send_scheduled_messages
+
+        ScheduledMessage.objects.create(
+            sender=self.user,
+            work_item=self.work_item,
+            content='Another scheduled message',
+            scheduled_time=self.past_time
+        )
+
+        result = send_scheduled_messages()
+
+        self.assertEqual(result, {'status': 'queued', 'batches': 2})
+        mock_group.return_value.apply_async.assert_called_once()
+        self.assertEqual(len(list(mock_group.call_args[0][0])), 2)
+
     @patch('workspace.models.Notification.objects.create')
     def test_deliver_slow_channel_messages_task(self, mock_create_notification):
         """Test task to deliver slow channel messages"""
@@ -640,10 +763,41 @@ class CeleryTaskTests(TestCase):
         self.assertEqual(result['failed'], 0)
         
         # Message should be marked as delivered
-        self.sc_message.refresh_from_db()
+        self.sc_message.refresh_from_db(fields=['is_delivered', 'delivered_at'])
         self.assertTrue(self.sc_message.is_delivered)
         self.assertIsNotNone(self.sc_message.delivered_at)
     
+    def test_deliver_slow_channel_message_batch_isolates_failures(self):
+        """Test that one message failing mid-way rolls back only its own notifications"""
+        from workspace.tasks import deliver_slow_channel_message_batch
+        
+        bad_message = SlowChannelMessage.objects.create(
+            channel=self.slow_channel,
+            user=self.user,
+            content='This one fails',
+            scheduled_delivery=self.past_time,
+            is_delivered=False
+        )
+        
+        def notify_participants(message):
+            Notification.objects.create(
+                user=self.user,
+                message=f'Partial notification for #{message.id}',
+                notification_type='message'
+            )
+            if message.id == bad_message.id:
+                raise RuntimeError('Notification insert failed')
+        
+        with patch.object(SlowChannelMessage, 'notify_participants', autospec=True, side_effect=notify_participants):
+            result = deliver_slow_channel_message_batch([self.sc_message.id, bad_message.id])
+        
+        self.assertEqual(result['delivered'], 1)
+        self.assertEqual(result['failed'], 1)
+        self.assertTrue(SlowChannelMessage.objects.get(id=self.sc_message.id).is_delivered)
+        self.assertFalse(SlowChannelMessage.objects.get(id=bad_message.id).is_delivered)
+        self.assertTrue(Notification.objects.filter(message=f'Partial notification for #{self.sc_message.id}').exists())
+        self.assertFalse(Notification.objects.filter(message=f'Partial notification for #{bad_message.id}').exists())
+    
     @patch('workspace.models.SlowChannel.get_next_delivery_time')
     def test_schedule_new_message_delivery_task(self, mock_next_delivery):
         """Test task to schedule new message delivery"""
@@ -668,118 +822,140 @@ class CeleryTaskTests(TestCase):
         self.assertEqual(result['status'], 'success')
         
         # Message should have scheduled delivery time
-        message.refresh_from_db()
+        message.refresh_from_db(fields=['scheduled_delivery'])
         self.assertEqual(message.scheduled_delivery, delivery_time)
 
 
 class ScheduledTaskManagementCommandTests(TestCase):
     """Tests for management commands related to scheduled tasks"""
     
-    def setUp(self):
-        """Set up test data"""
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data once for the whole class"""
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpassword'
         )
         
-        self.work_item = WorkItem.objects.create(
+        cls.work_item = WorkItem.objects.create(
             title='Test Work Item',
             description='This is a test work item',
             type='task',
-            owner=self.user
+            owner=cls.user
         )
         
         # Set scheduled time to be in the past
-        self.past_time = timezone.now() - datetime.timedelta(hours=1)
+        cls.past_time = timezone.now() - datetime.timedelta(hours=1)
         
-        self.scheduled_message = ScheduledMessage.objects.create(
-            sender=self.user,
-            work_item=self.work_item,
+        cls.scheduled_message = ScheduledMessage.objects.create(
+            sender=cls.user,
+            work_item=cls.work_item,
             content='This is a scheduled message',
-            scheduled_time=self.past_time,
+            scheduled_time=cls.past_time,
             is_sent=False
         )
         
         # Create a slow channel
-        self.slow_channel = SlowChannel.objects.create(
+        cls.slow_channel = SlowChannel.objects.create(
             title='Reflection Channel',
             description='For team reflections',
             type='reflection',
-            work_item=self.work_item,
-            created_by=self.user,
+            work_item=cls.work_item,
+            created_by=cls.user,
             message_frequency='daily'
         )
-        self.slow_channel.participants.add(self.user)
+        cls.slow_channel.participants.add(cls.user)
         
         # Create a slow channel message scheduled for delivery
-        self.sc_message = SlowChannelMessage.objects.create(
-            channel=self.slow_channel,
-            user=self.user,
+        cls.sc_message = SlowChannelMessage.objects.create(
+            channel=cls.slow_channel,
+            user=cls.user,
             content='This is a slow channel message',
-            scheduled_delivery=self.past_time,
+            scheduled_delivery=cls.past_time,
             is_delivered=False
         )
     
-    @patch('workspace.management.commands.send_scheduled_messages.ScheduledMessage.send')
-    def test_send_scheduled_messages_command(self, mock_send):
+    def test_send_scheduled_messages_command(self):
         """Test the send_scheduled_messages management command"""
-        # Mock the send method
-        mock_send.return_value = MagicMock()
-        
         # Call the command
-        from django.core.management import call_command
-        from io import StringIO
         out = StringIO()
-        call_command('send_scheduled_messages', stdout=out)
+        call_command('send_scheduled_messages', stdout=out, verbosity=0)
         
         # Check command output
         output = out.getvalue()
         self.assertIn('Found 1 scheduled messages to send', output)
         self.assertIn('1 sent successfully', output)
+        self.assertNotIn('Sent scheduled message #', output)
         
-        # Send should have been called once
-        mock_send.assert_called_once()
+        # The message should have been posted and the schedule flagged as sent
+        self.scheduled_message.refresh_from_db(fields=['is_sent'])
+        self.assertTrue(self.scheduled_message.is_sent)
+        self.assertTrue(Message.objects.filter(content='This is a scheduled message', is_scheduled=True).exists())
     
-    @patch('workspace.management.commands.deliver_slow_channel_messages.SlowChannelMessage.mark_delivered')
-    def test_deliver_slow_channel_messages_command(self, mock_mark_delivered):
+    def test_deliver_slow_channel_messages_command(self):
         """Test the deliver_slow_channel_messages management command"""
         # Call the command
-        from django.core.management import call_command
-        from io import StringIO
         out = StringIO()
-        call_command('deliver_slow_channel_messages', stdout=out)
+        call_command('deliver_slow_channel_messages', stdout=out, verbosity=0)
         
         # Check command output
         output = out.getvalue()
         self.assertIn('Found 1 slow channel messages to deliver', output)
         self.assertIn('1 delivered successfully', output)
+        self.assertNotIn('Delivered slow channel message #', output)
         
-        # mark_delivered should have been called once
-        mock_mark_delivered.assert_called_once()
+        # The message should have been flagged as delivered
+        self.sc_message.refresh_from_db(fields=['is_delivered', 'delivered_at'])
+        self.assertTrue(self.sc_message.is_delivered)
+        self.assertIsNotNone(self.sc_message.delivered_at)
+    
+    @patch('workspace.management.commands.deliver_slow_channel_messages.DELIVERY_BATCH_SIZE', 2)
+    def test_deliver_slow_channel_messages_command_batches(self):
+        """Test that the command walks a long backlog in fixed-size batches"""
+        SlowChannelMessage.objects.bulk_create([
+            SlowChannelMessage(
+                channel=self.slow_channel,
+                user=self.user,
+                content=f'Backlog message {index}',
+                scheduled_delivery=self.past_time
+            )
+            for index in range(4)
+        ])
+        
+        out = StringIO()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('deliver_slow_channel_messages', stdout=out, verbosity=0)
+        
+        # Five due messages in batches of two: three UPDATEs
+        updates = [query for query in ctx.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 3)
+        self.assertIn('5 delivered successfully, 0 failed', out.getvalue())
+        self.assertFalse(SlowChannelMessage.objects.filter(is_delivered=False).exists())
 
 
 class NotificationHandlingTests(TestCase):
     """Tests for notification handling logic"""
     
-    def setUp(self):
-        """Set up test data"""
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data once for the whole class"""
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpassword'
         )
         
-        self.work_item = WorkItem.objects.create(
+        cls.work_item = WorkItem.objects.create(
             title='Test Work Item',
             description='This is a test work item',
             type='task',
-            owner=self.user
+            owner=cls.user
         )
         
         # Instead of creating a new preference, get or update the existing one
-        self.notification_pref, created = NotificationPreference.objects.get_or_create(
-            user=self.user,
+        cls.notification_pref, _ = NotificationPreference.objects.update_or_create(
+            user=cls.user,
             defaults={
                 'dnd_enabled': True,
                 'dnd_start_time': datetime.time(22, 0),
@@ -788,28 +964,24 @@ class NotificationHandlingTests(TestCase):
             }
         )
         
-        # If it already existed, update it
-        if not created:
-            self.notification_pref.dnd_enabled = True
-            self.notification_pref.dnd_start_time = datetime.time(22, 0)
-            self.notification_pref.dnd_end_time = datetime.time(8, 0)
-            self.notification_pref.notification_mode = 'all'
-            self.notification_pref.save()
-        
-        self.notification = Notification.objects.create(
-            user=self.user,
+        cls.notification = Notification.objects.create(
+            user=cls.user,
             message='Test notification',
-            work_item=self.work_item,
+            work_item=cls.work_item,
             notification_type='message',
             priority='normal'
         )
     
-    @patch('workspace.signals._deliver_notification')
-    def test_send_notification_normal_hours(self, mock_deliver):
-        """Test sending notifications during normal hours"""
-        from workspace.signals import send_notification
-        import datetime
+    def setUp(self):
+        """Start each test with empty caches"""
+        # Cached preference snapshots and unread counters outlive the per-test rollback
+        cache.clear()
         
+        # Nothing here should reach the channel layer
+        self.mock_deliver = self.enterContext(patch('workspace.signals._deliver_notification'))
+    
+    def test_send_notification_normal_hours(self):
+        """Test sending notifications during normal hours"""
         # Debug current state
         print("\nCurrent time:", timezone.now())
         print("Notification delivery status:", getattr(self.notification, 'is_sent', False))
@@ -842,67 +1014,35 @@ class NotificationHandlingTests(TestCase):
         # Send the notification
         send_notification(self.notification)
         
-        # Refresh the notification to see any changes
-        self.notification.refresh_from_db()
+        # Refresh the flags send_notification could have changed
+        self.notification.refresh_from_db(fields=['is_sent', 'is_delayed', 'is_from_muted', 'is_focus_filtered'])
         print("Notification attributes after:", self.notification.__dict__)
-        print("_deliver_notification called:", mock_deliver.called)
+        print("_deliver_notification called:", self.mock_deliver.called)
         
         # Assert that deliver was called
-        mock_deliver.assert_called_once_with(self.notification)
+        self.mock_deliver.assert_called_once_with(self.notification)
     
-    @patch('workspace.models.timezone')
-    @patch('workspace.signals._deliver_notification')
-    def test_send_notification_dnd_hours(self, mock_deliver, mock_timezone):
+    def test_send_notification_dnd_hours(self):
         """Test sending notifications during DND hours"""
-        from workspace.signals import send_notification
-        
-        # Create a real datetime for the mock
-        mock_now = datetime.datetime(2025, 1, 1, 23, 0, 0)  # 11:00 PM
-        
-        # Mock time to be during DND hours (11 PM)
-        mock_time = MagicMock()
-        mock_time.time.return_value = datetime.time(23, 0)
-        mock_timezone.localtime.return_value = mock_time
-        mock_timezone.now.return_value = mock_now
-        
-        # Make sure is_in_dnd_period returns True for our test
-        with patch('workspace.models.NotificationPreference.is_in_dnd_period', return_value=True):
-            # Ensure DND is enabled
-            self.notification_pref.dnd_enabled = True
-            self.notification_pref.dnd_start_time = datetime.time(22, 0)
-            self.notification_pref.dnd_end_time = datetime.time(8, 0)
-            self.notification_pref.save()
-            
-            # Send the notification
-            send_notification(self.notification)
-            
-            # Should not deliver
-            mock_deliver.assert_not_called()
-            
-            # Notification should be marked as delayed
-            self.notification.refresh_from_db()
-            self.assertTrue(self.notification.is_delayed)
-    
-    @patch('workspace.signals._deliver_notification')
-    def test_send_notification_urgent(self, mock_deliver):
-        """Test sending urgent notifications (bypass DND)"""
-        from workspace.signals import send_notification
+        # Ensure DND is enabled
+        self.notification_pref.dnd_enabled = True
+        self.notification_pref.dnd_start_time = datetime.time(22, 0)
+        self.notification_pref.dnd_end_time = datetime.time(8, 0)
+        self.notification_pref.save()
         
-        # Make notification urgent
-        self.notification.priority = 'urgent'
-        self.notification.save()
+        # Pin the local clock to 11:00 PM, inside the DND window
+        late_night = timezone.make_aware(datetime.datetime(2025, 1, 1, 23, 0))
+        with patch('django.utils.timezone.localtime', return_value=late_night):
+            send_notification(self.notification)
         
-        # Send the notification
-        send_notification(self.notification)
+        # Should not deliver
+        self.mock_deliver.assert_not_called()
         
-        # Should deliver even during DND
-        mock_deliver.assert_called_once_with(self.notification)
+        # Notification should be marked as delayed; send_notification sets the flag on this instance
+        self.assertTrue(self.notification.is_delayed)
     
-    @patch('workspace.signals._deliver_notification')
-    def test_send_notification_muted_work_item(self, mock_deliver):
+    def test_send_notification_muted_work_item(self):
         """Test sending notifications for muted work item"""
-        from workspace.signals import send_notification
-        
         # Debug initial state
         print("Initial muted channels:", list(self.notification_pref.muted_channels.all()))
         
@@ -910,8 +1050,7 @@ class NotificationHandlingTests(TestCase):
         self.notification_pref.muted_channels.add(self.work_item)
         self.notification_pref.save()
         
-        # Verify muting worked
-        self.notification_pref.refresh_from_db()
+        # Verify muting worked; the m2m rows are read fresh, no row reload needed
         print("After adding, muted channels:", list(self.notification_pref.muted_channels.all()))
         
         # Make sure notification is normal priority
@@ -921,29 +1060,204 @@ class NotificationHandlingTests(TestCase):
         # Send the notification
         send_notification(self.notification)
         
-        # Refresh the notification to get updated flags
-        self.notification.refresh_from_db()
-        
-        # Debug the flags
+        # Debug the flags; send_notification sets them on this instance as it saves them
         print("is_from_muted flag:", getattr(self.notification, 'is_from_muted', False))
         
         # Verify it's marked as from muted source
         self.assertTrue(self.notification.is_from_muted)
         
         # Verify deliver wasn't called
-        mock_deliver.assert_not_called()
+        self.mock_deliver.assert_not_called()
     
+    def test_message_notifies_work_item_members(self):
+        """Test that a new message notifies the owner and collaborators but not the sender"""
+        collaborator = User.objects.create_user('collab', 'collab@example.com', 'collabpass')
+        sender = User.objects.create_user('msgsender', 'msgsender@example.com', 'senderpass')
+        self.work_item.collaborators.add(collaborator, sender)
+
+        Message.objects.create(work_item=self.work_item, user=sender, content='Hello team')
+
+        notified = set(
+            Notification.objects.filter(notification_type='message').values_list('user_id', flat=True)
+        )
+        self.assertEqual(notified, {self.user.id, collaborator.id})
+
+    def test_work_item_update_notifies_owner_and_collaborators(self):
+        """Test that a work item update notifies everyone on it except the editor"""
+        collaborator = User.objects.create_user('collab', 'collab@example.com', 'collabpass')
+        editor = User.objects.create_user('editor', 'editor@example.com', 'editorpass')
+        self.work_item.collaborators.add(collaborator, editor)
+
+        self.work_item.updated_by = editor
+        self.work_item.save()
+
+        notified = set(
+            Notification.objects.filter(notification_type='update').values_list('user_id', flat=True)
+        )
+        self.assertEqual(notified, {self.user.id, collaborator.id})
+
+    def test_muted_recipient_notification_created_filtered(self):
+        """Test that a muted recipient's notification is inserted already flagged and never queued"""
+        sender = User.objects.create_user('msgsender', 'msgsender@example.com', 'senderpass')
+        self.work_item.collaborators.add(sender)
+        self.notification_pref.muted_channels.add(self.work_item)
+
+        with patch('workspace.signals._dispatch_on_commit') as mock_dispatch:
+            Message.objects.create(work_item=self.work_item, user=sender, content='Hello team')
+
+        notification = Notification.objects.get(message__startswith='New message from msgsender')
+        self.assertTrue(notification.is_from_muted)
+        mock_dispatch.assert_not_called()
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer'}})
+    @patch('workspace.tasks.dispatch_notifications.delay')
+    def test_message_notifications_dispatched_on_commit(self, mock_delay):
+        """Test that message notifications are queued for a worker once the transaction commits"""
+        sender = User.objects.create_user('msgsender', 'msgsender@example.com', 'senderpass')
+        self.work_item.collaborators.add(sender)
+        self.notification_pref.dnd_enabled = False
+        self.notification_pref.save()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(work_item=self.work_item, user=sender, content='Hello team')
+            mock_delay.assert_not_called()
+
+        notification = Notification.objects.get(message__startswith='New message from msgsender')
+        mock_delay.assert_called_once_with([notification.id])
+
+    @patch('workspace.tasks.dispatch_notifications.delay')
+    def test_message_notifications_pushed_in_process_with_in_memory_layer(self, mock_delay):
+        """Test that an in-memory channel layer never hands the push to a worker, which couldn't reach the sockets"""
+        sender = User.objects.create_user('msgsender', 'msgsender@example.com', 'senderpass')
+        self.work_item.collaborators.add(sender)
+        self.notification_pref.dnd_enabled = False
+        self.notification_pref.save()
+
+        with patch('workspace.signals._group_send') as mock_group_send:
+            with self.captureOnCommitCallbacks(execute=True):
+                Message.objects.create(work_item=self.work_item, user=sender, content='Hello team')
+
+        mock_delay.assert_not_called()
+        mock_group_send.assert_called_once()
+        notification = Notification.objects.get(message__startswith='New message from msgsender')
+        self.assertTrue(notification.is_sent)
+
+    def test_dispatch_notifications_batch_query_count(self):
+        """Test that dispatching a batch costs the same number of queries however large it is"""
+        from workspace.tasks import dispatch_notifications
+        
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                user=self.user,
+                message=f'Batch notification {index}',
+                work_item=self.work_item,
+                notification_type='message'
+            )
+            for index in range(50)
+        ])
+        notification_ids = [notification.id for notification in notifications]
+        
+        with patch('workspace.signals._group_send') as mock_group_send:
+            # Load the batch, count the unread notifications once, flag the batch as sent
+            with self.assertNumQueries(3):
+                result = dispatch_notifications(notification_ids)
+        
+        self.assertEqual(result['dispatched'], 50)
+        self.assertEqual(mock_group_send.call_count, 50)
+        self.assertFalse(Notification.objects.filter(id__in=notification_ids, is_sent=False).exists())
+
+    @patch('workspace.utils._cache_is_shared', return_value=True)
+    def test_preferences_snapshot_cache_invalidated_on_mute(self, mock_shared):
+        """Test that cached preferences are reused and refreshed when a channel is muted"""
+        from workspace.utils import get_preferences_snapshot
+
+        snapshot = get_preferences_snapshot(self.user.id)
+        self.assertNotIn(self.work_item.id, snapshot.muted_channel_ids)
+
+        # A second lookup is served from the cache
+        with self.assertNumQueries(0):
+            get_preferences_snapshot(self.user.id)
+
+        self.notification_pref.muted_channels.add(self.work_item)
+
+        snapshot = get_preferences_snapshot(self.user.id)
+        self.assertIn(self.work_item.id, snapshot.muted_channel_ids)
+
+    @patch('workspace.utils._cache_is_shared', return_value=True)
+    def test_unread_counter_tracks_create_and_mark_read(self, mock_shared):
+        """Test that the cached unread counter follows new and read notifications"""
+        from workspace.utils import get_unread_notification_count
+
+        self.assertEqual(get_unread_notification_count(self.user.id), 1)
+
+        new_notification = Notification.objects.create(
+            user=self.user,
+            message='Another notification',
+            work_item=self.work_item,
+            notification_type='message'
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_notification_count(self.user.id), 2)
+
+        self.client.force_login(self.user)
+        self.client.get(reverse('mark_notification_read', args=[new_notification.pk]))
+        self.assertEqual(get_unread_notification_count(self.user.id), 1)
+
+    def test_process_local_cache_reads_from_database(self):
+        """Test that a per-process cache isn't trusted, since other processes' writes never reach it"""
+        from workspace.utils import get_preferences_snapshot, get_unread_notification_count
+
+        self.assertEqual(get_unread_notification_count(self.user.id), 1)
+        get_preferences_snapshot(self.user.id)
+
+        # Writes another process would make, bypassing this process's cache
+        Notification.objects.bulk_create([
+            Notification(user=self.user, message='From a worker', work_item=self.work_item, notification_type='message')
+        ])
+        NotificationPreference.objects.filter(pk=self.notification_pref.pk).update(focus_mode=True)
+
+        self.assertEqual(get_unread_notification_count(self.user.id), 2)
+        self.assertTrue(get_preferences_snapshot(self.user.id).focus_mode)
+
+    def test_should_notify_without_shared_cache_checks_lists_directly(self):
+        """Test that should_notify asks only about the lists that apply instead of rebuilding a snapshot"""
+        self.notification_pref.dnd_enabled = False
+        self.notification_pref.save(update_fields=['dnd_enabled'])
+        
+        # One EXISTS on the muted channels; focus mode is off, so nothing else
+        with self.assertNumQueries(1):
+            self.assertTrue(self.notification_pref.should_notify(work_item=self.work_item))
+        
+        self.notification_pref.muted_channels.add(self.work_item)
+        self.assertFalse(self.notification_pref.should_notify(work_item=self.work_item))
+
+    def test_chat_consumer_notifications_stored_without_push(self):
+        """Test that WebSocket chat messages only store notification rows, as they always have"""
+        from workspace.consumers import ChatConsumer
+        
+        sender = User.objects.create_user('chatsender', 'chatsender@example.com', 'senderpass')
+        collaborator = User.objects.create_user('chatcollab', 'chatcollab@example.com', 'collabpass')
+        self.work_item.collaborators.add(sender, collaborator)
+        message = Message(work_item=self.work_item, user=sender, content='Hi from the chat')
+        
+        with patch('workspace.signals._dispatch_on_commit') as mock_dispatch:
+            # Call the wrapped sync function; the consumer runs it through database_sync_to_async
+            ChatConsumer.__dict__['create_notifications'].func(ChatConsumer(), message, sender.id)
+        
+        notified = set(
+            Notification.objects.filter(message__startswith='chatsender sent a message').values_list('user_id', flat=True)
+        )
+        self.assertEqual(notified, {self.user.id, collaborator.id})
+        mock_dispatch.assert_not_called()
+
     def test_send_notification_focus_mode_simplified(self, *args):
         """
         Simplified test for focus mode filtering that avoids mocking issues.
         Added *args to handle any extra arguments the test runner might pass.
         """
-        from workspace.signals import send_notification
-        # Removed unused import 'types'
-        
         # Enable focus mode
         self.notification_pref.focus_mode = True
-        self.notification_pref.save()
+        self.notification_pref.save(update_fields=['focus_mode'])
         
         # Create another user for focus users
         other_user = User.objects.create_user('other', 'other@example.com', 'otherpass')
@@ -962,7 +1276,6 @@ class NotificationHandlingTests(TestCase):
         self.notification_pref.focus_work_items.add(focus_work_item)
         
         # Force a database flush/sync to ensure IDs are committed
-        from django.db import connection
         connection.cursor().execute("SELECT 1")
         
         # Create a completely separate work item that's not in focus
@@ -1005,7 +1318,7 @@ class NotificationHandlingTests(TestCase):
             send_notification(non_focus_notif)
             
             # Refresh notification from db
-            non_focus_notif.refresh_from_db()
+            non_focus_notif.refresh_from_db(fields=['is_focus_filtered'])
             
             # Print notification state
             print("After send_notification:")
@@ -1024,6 +1337,110 @@ class NotificationHandlingTests(TestCase):
             # Restore the original function
             if original_func is not None:
                 workspace.signals._deliver_notification = original_func
+
+
+class NotificationRoutingTests(SimpleTestCase):
+    """Tests for notification routing decisions; unsaved objects and in-memory preferences, no database"""
+    
+    def setUp(self):
+        self.user = User(id=1, username='testuser')
+        self.work_item = WorkItem(id=1, title='Test Work Item', type='task', owner=self.user)
+        self.preferences = NotificationPreference(
+            user=self.user,
+            dnd_enabled=True,
+            dnd_start_time=datetime.time(22, 0),
+            dnd_end_time=datetime.time(8, 0),
+            work_days='1234567',
+            work_start_time=datetime.time(0, 0),
+            work_end_time=datetime.time(23, 59)
+        )
+        self.notification = Notification(
+            id=1,
+            user=self.user,
+            message='Test notification',
+            work_item=self.work_item,
+            notification_type='message',
+            priority='normal'
+        )
+        # Noon on a Wednesday, outside the DND window
+        self.daytime = datetime.datetime(2025, 1, 1, 12, 0)
+    
+    def _snapshot(self, **overrides):
+        """Build the preferences snapshot send_notification works from"""
+        from workspace.utils import PreferencesSnapshot, MODE_ALL
+        
+        values = {
+            'preferences': self.preferences,
+            'mode': MODE_ALL,
+            'mention_token': '@testuser',
+            'focus_mode': False,
+        }
+        values.update(overrides)
+        return PreferencesSnapshot(**values)
+    
+    @patch('workspace.signals._deliver_notification')
+    def test_send_notification_urgent(self, mock_deliver):
+        """Test sending urgent notifications (bypass DND)"""
+        # Make notification urgent
+        self.notification.priority = 'urgent'
+        
+        # Send the notification; urgent ones never look up preferences
+        send_notification(self.notification)
+        
+        # Should deliver even during DND
+        mock_deliver.assert_called_once_with(self.notification)
+    
+    @patch('workspace.signals._deliver_notification')
+    def test_failed_preference_check_is_logged_and_delivered(self, mock_deliver):
+        """Test that a broken preference check leaves an error in the log instead of failing silently"""
+        snapshot = self._snapshot()
+        
+        with patch('workspace.signals.evaluate_notification', side_effect=RuntimeError('broken preferences')):
+            with self.assertLogs('workspace.signals', level='ERROR') as logs:
+                send_notification(self.notification, preferences=snapshot)
+        
+        self.assertIn('broken preferences', logs.output[0])
+        mock_deliver.assert_called_once_with(self.notification)
+    
+    @patch('workspace.signals._deliver_notification')
+    def test_send_notification_muted_work_item_only_saves_flag(self, mock_deliver):
+        """Test that a muted notification writes just its flag and isn't delivered"""
+        snapshot = self._snapshot(muted_channel_ids=frozenset({self.work_item.id}))
+        
+        with patch.object(Notification, 'save') as mock_save:
+            send_notification(self.notification, preferences=snapshot)
+        
+        self.assertTrue(self.notification.is_from_muted)
+        mock_save.assert_called_once_with(update_fields=['is_from_muted'])
+        mock_deliver.assert_not_called()
+    
+    def test_evaluate_notification_mode_none_skips(self):
+        """Test that notification mode 'none' drops notifications"""
+        from workspace.signals import evaluate_notification, SKIP
+        from workspace.utils import MODE_NONE
+        
+        outcome = evaluate_notification(self.notification, self._snapshot(mode=MODE_NONE), now=self.daytime)
+        
+        self.assertEqual(outcome, SKIP)
+    
+    def test_evaluate_notification_focus_mode(self):
+        """Test that focus mode only lets focused work items through"""
+        from workspace.signals import evaluate_notification, DELIVER, FOCUS_FILTERED
+        
+        unfocused = self._snapshot(focus_mode=True, focus_work_item_ids=frozenset({99}))
+        focused = self._snapshot(focus_mode=True, focus_work_item_ids=frozenset({self.work_item.id}))
+        
+        self.assertEqual(evaluate_notification(self.notification, unfocused, now=self.daytime), FOCUS_FILTERED)
+        self.assertEqual(evaluate_notification(self.notification, focused, now=self.daytime), DELIVER)
+    
+    def test_evaluate_notification_dnd_delays(self):
+        """Test that normal notifications are delayed during DND hours"""
+        from workspace.signals import evaluate_notification, DELAYED, DELIVER
+        
+        late_night = datetime.datetime(2025, 1, 1, 23, 0)
+        
+        self.assertEqual(evaluate_notification(self.notification, self._snapshot(), now=late_night), DELAYED)
+        self.assertEqual(evaluate_notification(self.notification, self._snapshot(), now=self.daytime), DELIVER)
         
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,3 +1,9 @@
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+
+
 def get_user_unread_count(user, thread=None, work_item=None):
     """Get count of unread messages for a user in a specific thread or work item"""
     from django.db.models import Q, Exists, OuterRef
@@ -22,4 +28,201 @@ def get_user_unread_count(user, thread=None, work_item=None):
     
     unread_messages = base_query.filter(~Exists(receipts_subquery))
     
-    return unread_messages.count()
\ No newline at end of file
+    return unread_messages.count()
+
+
+# Cache backends that keep entries inside a single process
+_PROCESS_LOCAL_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def _cache_is_shared():
+    """
+    True when the web and worker processes read the same cache. Otherwise a
+    cached snapshot or counter would only see the writes of its own process.
+    """
+    return settings.CACHES['default']['BACKEND'] not in _PROCESS_LOCAL_CACHE_BACKENDS
+
+
+# How long (in seconds) a user's notification preferences stay cached
+PREFERENCES_CACHE_TIMEOUT = 300
+
+PREFERENCES_CACHE_KEY = 'notification_prefs:{user_id}'
+
+# Integer codes for NotificationPreference.notification_mode, compared on every notification
+MODE_ALL = 0
+MODE_NONE = 1
+MODE_MENTIONS = 2
+
+NOTIFICATION_MODE_CODES = {
+    'all': MODE_ALL,
+    'none': MODE_NONE,
+    'mentions': MODE_MENTIONS,
+}
+
+# Many-to-many relations on NotificationPreference that are copied into snapshots
+_PREFERENCE_ID_SETS = {
+    'muted_channel_ids': 'muted_channels',
+    'muted_thread_ids': 'muted_threads',
+    'focus_work_item_ids': 'focus_work_items',
+    'focus_user_ids': 'focus_users',
+}
+
+
+@dataclass(frozen=True)
+class PreferencesSnapshot:
+    """Read-only copy of a user's notification preferences used when routing notifications"""
+    preferences: object
+    mode: int
+    mention_token: str
+    focus_mode: bool
+    muted_channel_ids: frozenset = frozenset()
+    muted_thread_ids: frozenset = frozenset()
+    focus_work_item_ids: frozenset = frozenset()
+    focus_user_ids: frozenset = frozenset()
+
+    def is_quiet_time(self, work_item=None, now=None):
+        """Check DND and work hours against the cached preference values"""
+        return self.preferences.is_quiet_time(work_item, now=now)
+
+
+def _preferences_cache_key(user_id):
+    return PREFERENCES_CACHE_KEY.format(user_id=user_id)
+
+
+def _load_preferences_snapshots(user_ids):
+    """Build snapshots for the given users with one query per relation"""
+    from workspace.models import NotificationPreference
+
+    preferences_by_id = {
+        preferences.id: preferences
+        for preferences in NotificationPreference.objects.filter(user_id__in=user_ids).select_related('user')
+    }
+    id_sets = {
+        preference_id: {attr: set() for attr in _PREFERENCE_ID_SETS}
+        for preference_id in preferences_by_id
+    }
+    for attr, field_name in _PREFERENCE_ID_SETS.items():
+        field = NotificationPreference._meta.get_field(field_name)
+        source = f'{field.m2m_field_name()}_id'
+        target = f'{field.m2m_reverse_field_name()}_id'
+        rows = field.remote_field.through.objects.filter(
+            **{f'{source}__in': preferences_by_id}
+        ).values_list(source, target)
+        for preference_id, related_id in rows:
+            id_sets[preference_id][attr].add(related_id)
+
+    return {
+        preferences.user_id: PreferencesSnapshot(
+            preferences=preferences,
+            mode=NOTIFICATION_MODE_CODES.get(preferences.notification_mode, MODE_ALL),
+            mention_token=f"@{preferences.user.username}",
+            focus_mode=preferences.focus_mode,
+            **{attr: frozenset(ids) for attr, ids in id_sets[preference_id].items()}
+        )
+        for preference_id, preferences in preferences_by_id.items()
+    }
+
+
+def get_preferences_snapshots(user_ids):
+    """Return a {user_id: PreferencesSnapshot} dict, loading cache misses in bulk"""
+    if not _cache_is_shared():
+        return _load_preferences_snapshots(list(user_ids))
+
+    keys = {user_id: _preferences_cache_key(user_id) for user_id in user_ids}
+    cached = cache.get_many(keys.values())
+    snapshots = {
+        user_id: cached[key] for user_id, key in keys.items() if key in cached
+    }
+
+    missing = [user_id for user_id in keys if user_id not in snapshots]
+    if missing:
+        loaded = _load_preferences_snapshots(missing)
+        cache.set_many(
+            {keys[user_id]: snapshot for user_id, snapshot in loaded.items()},
+            PREFERENCES_CACHE_TIMEOUT
+        )
+        snapshots.update(loaded)
+
+    return snapshots
+
+
+def get_preferences_snapshot(user_id):
+    """Return the cached PreferencesSnapshot for a user, or None if they have no preferences"""
+    return get_preferences_snapshots([user_id]).get(user_id)
+
+
+def invalidate_preferences_snapshots(user_ids):
+    """Drop cached preference snapshots so the next lookup reads the database"""
+    cache.delete_many([_preferences_cache_key(user_id) for user_id in user_ids])
+
+
+# Per-user unread notification counters, kept in step with Notification writes
+UNREAD_COUNT_CACHE_KEY = 'unread:{user_id}'
+
+# Upper bound on how long a counter can drift from the database before it is reseeded
+UNREAD_COUNT_CACHE_TIMEOUT = 300
+
+
+def _unread_count_cache_key(user_id):
+    return UNREAD_COUNT_CACHE_KEY.format(user_id=user_id)
+
+
+def _count_unread_notifications(user_ids):
+    """Count unread notifications per user with one grouped query"""
+    from django.db.models import Count
+    from workspace.models import Notification
+
+    counts = dict.fromkeys(user_ids, 0)
+    counts.update(
+        Notification.objects.filter(user_id__in=user_ids, is_read=False)
+        .values('user_id')
+        .annotate(count=Count('id'))
+        .values_list('user_id', 'count')
+    )
+    return counts
+
+
+def get_unread_notification_counts(user_ids):
+    """Return a {user_id: unread count} dict, seeding missing counters from the database"""
+    user_ids = set(user_ids)
+    if not _cache_is_shared():
+        return _count_unread_notifications(user_ids)
+
+    keys = {user_id: _unread_count_cache_key(user_id) for user_id in user_ids}
+    cached = cache.get_many(keys.values())
+    counts = {
+        user_id: cached[key] for user_id, key in keys.items() if key in cached
+    }
+
+    missing = [user_id for user_id in keys if user_id not in counts]
+    if missing:
+        for user_id, count in _count_unread_notifications(missing).items():
+            # add() only writes if no other process seeded the counter in the meantime
+            if not cache.add(keys[user_id], count, UNREAD_COUNT_CACHE_TIMEOUT):
+                count = cache.get(keys[user_id], count)
+            counts[user_id] = count
+
+    return {user_id: max(count, 0) for user_id, count in counts.items()}
+
+
+def get_unread_notification_count(user_id):
+    """Return the user's unread notification count, seeding the counter from the database if needed"""
+    return get_unread_notification_counts([user_id])[user_id]
+
+
+def adjust_unread_notification_count(user_id, delta):
+    """Add delta to a seeded counter; unseeded counters are filled on the next read"""
+    if not _cache_is_shared():
+        return
+    try:
+        cache.incr(_unread_count_cache_key(user_id), delta)
+    except ValueError:
+        pass
+
+
+def invalidate_unread_notification_counts(user_ids):
+    """Drop counters after bulk updates so the next read recounts from the database"""
+    cache.delete_many([_unread_count_cache_key(user_id) for user_id in user_ids])
@@ -24,7 +24,7 @@ from django.views.decorators.http import require_POST, require_GET
 from django.views.decorators.csrf import csrf_exempt
 from .models import WorkItem, Message, Notification, NotificationPreference, ScheduledMessage, MessageReadReceipt, WorkItemType
 from .forms import WorkItemForm, MessageForm, ThreadForm, WorkItemTypeForm
-from django.db.models import Q
+from django.db.models import Q, Count
 from django.db import IntegrityError
 from .models import Thread, FileAttachment, SlowChannel, SlowChannelMessage
 from .forms import FileAttachmentForm, NotificationPreferenceForm, ScheduledMessageForm, SlowChannelForm, SlowChannelParticipantsForm, SlowChannelMessageForm
@@ -62,14 +62,18 @@ from django.contrib.auth.models import User
 from datetime import timedelta
 from django.contrib.sessions.models import Session
 from django.core.paginator import Paginator  # Add this import at the top
+from .utils import adjust_unread_notification_count, invalidate_unread_notification_counts
 
 logger = logging.getLogger(__name__)
 
 @login_required
 def dashboard(request):
     # Get all items where user is either owner or collaborator
+    # Load owners and message counts with the items so the cards don't query per item
     work_items = WorkItem.objects.filter(
         Q(owner=request.user) | Q(collaborators=request.user)
+    ).select_related('owner').annotate(
+        message_count=Count('messages', distinct=True)
     ).distinct()
     
     context = {
@@ -108,6 +112,7 @@ def work_item_detail(request, pk):
             work_item=work_item,
             is_read=False
         ).update(is_read=True)
+        invalidate_unread_notification_counts([request.user.id])
     
     context = {
         'work_item': work_item,
@@ -347,8 +352,10 @@ def notifications_list(request):
 @login_required
 def mark_notification_read(request, pk):
     notification = get_object_or_404(Notification, pk=pk, user=request.user)
-    notification.is_read = True
-    notification.save()
+    if not notification.is_read:
+        notification.is_read = True
+        notification.save()
+        adjust_unread_notification_count(request.user.id, -1)
     
     # If this is an AJAX request, return a JSON response
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
@@ -360,6 +367,7 @@ def mark_notification_read(request, pk):
 @login_required
 def mark_all_read(request):
     request.user.notifications.update(is_read=True)
+    invalidate_unread_notification_counts([request.user.id])
     
     # If this is an AJAX request, return a JSON response
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
@@ -646,7 +654,12 @@ def edit_scheduled_message(request, pk):
 def mark_message_read(request, message_id):
     """API endpoint to mark a message as read"""
     try:
-        message = get_object_or_404(Message, pk=message_id)
+        message = get_object_or_404(
+            Message.objects.select_related(
+                'user', 'work_item__owner', 'thread__created_by', 'thread__work_item__owner'
+            ),
+            pk=message_id
+        )
         thread = message.thread
         work_item = message.work_item
         
@@ -694,7 +707,12 @@ def mark_message_read(request, message_id):
 def get_message_read_status(request, message_id):
     """API endpoint to get read status of a message"""
     try:
-        message = get_object_or_404(Message, pk=message_id)
+        message = get_object_or_404(
+            Message.objects.select_related(
+                'user', 'work_item__owner', 'thread__created_by', 'thread__work_item__owner'
+            ),
+            pk=message_id
+        )
         thread = message.thread
         work_item = message.work_item
         
@@ -723,10 +741,10 @@ def get_message_read_status(request, message_id):
         
         # Filter out users who have disabled sharing read receipts
         from django.db.models import Q
-        users_not_sharing = User.objects.filter(
+        users_not_sharing = set(User.objects.filter(
             Q(notification_preferences__share_read_receipts=False) | 
             Q(notification_preferences__isnull=True)
-        ).values_list('id', flat=True)
+        ).values_list('id', flat=True))
         
         # Format response
         response = {
@@ -763,28 +781,26 @@ def get_message_read_status(request, message_id):
 def mark_thread_read(request, thread_id):
     """Mark all messages in a thread as read"""
     try:
-        thread = get_object_or_404(Thread, pk=thread_id)
+        thread = get_object_or_404(Thread.objects.select_related('created_by', 'work_item__owner'), pk=thread_id)
         
         # Check if user has access to this thread
         if not thread.user_can_access(request.user):
             return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
         
-        # Get all messages in thread not authored by current user
-        messages = Message.objects.filter(thread=thread).exclude(user=request.user)
+        # Get the ids of messages in thread not authored by current user and not yet read
+        unread_message_ids = list(
+            Message.objects.filter(thread=thread)
+            .exclude(user=request.user)
+            .exclude(read_receipts__user=request.user)
+            .values_list('id', flat=True)
+        )
         
-        # Mark all as read
-        read_count = 0
-        for message in messages:
-            try:
-                receipt, created = MessageReadReceipt.objects.get_or_create(
-                    message=message,
-                    user=request.user
-                )
-                if created:
-                    read_count += 1
-            except IntegrityError:
-                # Skip if already exists
-                pass
+        # Mark all as read with one INSERT; receipts created concurrently are skipped
+        MessageReadReceipt.objects.bulk_create(
+            [MessageReadReceipt(message_id=message_id, user=request.user) for message_id in unread_message_ids],
+            ignore_conflicts=True
+        )
+        read_count = len(unread_message_ids)
         
         return JsonResponse({
             'status': 'success', 
@@ -1745,6 +1761,7 @@ def get_notifications_ajax(request):
         
         # Mark these notifications as read
         recent_notifications.filter(is_read=False).update(is_read=True)
+        invalidate_unread_notification_counts([request.user.id])
         
         # Count remaining unread notifications
         unread_count = request.user.notifications.filter(is_read=False).count()